@@ -2,9 +2,11 @@ import json
 from typing import Callable, Optional
 from .qt_bindings import *
 
-from .utils import loadFile, load_json
+from .utils import asset_cache, loadFile, load_json
 from .PaletteFrame import PaletteFrame, ActionHandler
 from .basic_service import BasicService
+from .filter import SearchService
+from . import action_source, service_pool
 
 class CommandPalette(QMainWindow):
     def __init__(self, parent: Optional[QWidget] = None):
@@ -13,6 +15,9 @@ class CommandPalette(QMainWindow):
         self.setWindowFlags(Qt.Tool | Qt.FramelessWindowHint)
         self.setAttribute(Qt.WA_TranslucentBackground)  # Enable window transparency
 
+        asset_cache.setWatching(load_json("config.json").get("hot_reload", False))
+        asset_cache.changed.connect(self._on_asset_changed)
+
         # Set style sheet from window.css
         self.setStyleSheet(loadFile("theme/window.css"))
 
@@ -30,10 +35,16 @@ class CommandPalette(QMainWindow):
         self.setContentsMargins(shadow_width, shadow_width, shadow_width, shadow_width)
 
     def show(self, name: str, placeholder: str, actions_or_service, close_key: str, func: ActionHandler):
-        if isinstance(actions_or_service, list):
-            search_service = BasicService(None, name, actions_or_service)
-        else:
+        if isinstance(actions_or_service, SearchService):
             search_service = actions_or_service
+        elif isinstance(actions_or_service, list):
+            search_service = service_pool.acquire(
+                name, lambda: BasicService(None, name, actions_or_service))
+            action_source.release(name)
+            search_service.setActions(actions_or_service)
+            search_service.expected_size = 0
+        else:
+            search_service = action_source.lazy_service(name, actions_or_service)
 
         inner = PaletteFrame(self, name, close_key, search_service)
         self.setCentralWidget(inner)
@@ -44,6 +55,10 @@ class CommandPalette(QMainWindow):
         self._center_widgets(self, self.parentWidget())
         self.activateWindow()
 
+    def _on_asset_changed(self, filename: str):
+        if filename == "theme/window.css":
+            self.setStyleSheet(loadFile(filename))
+
     def focusOutEvent(self, event: QFocusEvent):
         self.close()
 
@@ -2,9 +2,9 @@ from typing import Callable, Optional
 from .qt_bindings import *
 
 from .action import Action
-from .filter import SearchService
+from .filter import SearchMetrics, SearchService
 from .PaletteItems import PaletteItems
-from .utils import loadFile
+from .utils import loadFile, load_json
 
 ActionHandler = Callable[[Action], bool]
 
@@ -22,10 +22,19 @@ class PaletteFrame(QFrame):
         self.items = PaletteItems(self, name, search_service)
         self.items.setAttribute(Qt.WA_MacShowFocusRect, 0)
 
+        # Search timings, shown when enabled under "metrics" in config.json
+        self.metrics_config = load_json("config.json").get("metrics", {})
+        self.status_line = None
+        if self.metrics_config.get("status_line"):
+            self.status_line = QLabel(self)
+            self.status_line.setObjectName("metrics")
+
         # Layout setup
         layout = QVBoxLayout(self)
         layout.addWidget(self.searchbox)
         layout.addWidget(self.items)
+        if self.status_line is not None:
+            layout.addWidget(self.status_line)
         layout.setContentsMargins(0, 0, 0, 0)
         layout.setSpacing(0)
         self.setLayout(layout)
@@ -35,6 +44,12 @@ class PaletteFrame(QFrame):
         self.searchbox.textChanged.connect(self._handle_text_changed)
         self.items.clicked.connect(self._handle_item_clicked)
         
+        if self.status_line is not None or self.metrics_config.get("log"):
+            search_service.metricsReady.connect(self._on_metrics)
+        search_service.profileReady.connect(self._on_profile)
+        if self.metrics_config.get("profile"):
+            search_service.requestProfile(self.metrics_config["profile"])
+
         # Install event filters
         self.searchbox.installEventFilter(self)
         self.items.installEventFilter(self)
@@ -46,8 +61,15 @@ class PaletteFrame(QFrame):
         if close_key:
             self.register_shortcut(QKeySequence(close_key), lambda: self.window().close())
 
-        self.register_shortcut(QKeySequence("Ctrl+J"), lambda: self._arrow_pressed(-1))
-        self.register_shortcut(QKeySequence("Ctrl+K"), lambda: self._arrow_pressed(1))
+        # Moves of auto-repeated keys queued up behind a slow frame are summed
+        # and applied together once the queue is drained
+        self.pending_move = 0
+        self.move_timer = QTimer(self)
+        self.move_timer.setSingleShot(True)
+        self.move_timer.timeout.connect(self._apply_move)
+
+        self.register_shortcut(QKeySequence("Ctrl+J"), lambda: self._move(-1))
+        self.register_shortcut(QKeySequence("Ctrl+K"), lambda: self._move(1))
         self.register_shortcut(QKeySequence("Esc"), lambda: self.window().close())
 
     def setItemClickedHandler(self, func: ActionHandler):
@@ -63,12 +85,30 @@ class PaletteFrame(QFrame):
         self.registered_keys[sequence] = shortcut
         return shortcut
 
-    def _arrow_pressed(self, delta: int):
-        new_row = self.items.currentIndex().row() + delta
-        row_count = self.items.model().rowCount()
-
-        new_row = max(0, min(new_row, row_count - 1))
-        self.items.setCurrentIndex(self.items.model().index(new_row, 0))
+    def _move(self, delta: int, coalesce: bool = False):
+        self.pending_move += delta
+        if not coalesce:
+            self.move_timer.stop()
+            self._apply_move()
+        elif not self.move_timer.isActive():
+            self.move_timer.start(0)
+
+    def _apply_move(self):
+        delta, self.pending_move = self.pending_move, 0
+        model = self.items.model()
+        count = model.resultCount()
+        if not delta or not count:
+            return
+
+        new_row = max(0, min(self.items.currentIndex().row() + delta, count - 1))
+        if new_row >= model.rowCount():
+            model.fetchTo(new_row)
+        self.items.setCurrentIndex(model.index(new_row, 0))
+
+    def _page_rows(self) -> int:
+        # Rows have a uniform size
+        row_height = self.items.sizeHintForRow(0) if self.items.model().rowCount() else 0
+        return max(1, self.items.viewport().height() // row_height) if row_height > 0 else 1
 
     def eventFilter(self, obj: QWidget, event: QEvent) -> bool:
         if event.type() == QEvent.KeyPress:
@@ -84,12 +124,12 @@ class PaletteFrame(QFrame):
                 return True
 
             if key_event.key() in (Qt.Key_Down, Qt.Key_Up):
-                self._arrow_pressed(1 if key_event.key() == Qt.Key_Down else -1)
+                self._move(1 if key_event.key() == Qt.Key_Down else -1, key_event.isAutoRepeat())
                 return True
 
             if key_event.key() in (Qt.Key_PageDown, Qt.Key_PageUp):
-                event.ignore()
-                self.items.keyPressEvent(key_event)
+                pages = 1 if key_event.key() == Qt.Key_PageDown else -1
+                self._move(pages * self._page_rows(), key_event.isAutoRepeat())
                 return True
 
         elif event.type() == QEvent.FocusOut:
@@ -111,6 +151,18 @@ class PaletteFrame(QFrame):
     def setPlaceholderText(self, placeholder: str):
         self.searchbox.setPlaceholderText(placeholder)
 
+    def _on_metrics(self, metrics: SearchMetrics):
+        if metrics.generation != self.items.model().generation:
+            return
+
+        if self.status_line is not None:
+            self.status_line.setText(metrics.summary())
+        if self.metrics_config.get("log"):
+            print(f"[ifred] {self.name} {metrics.keyword!r}: {metrics.summary()}")
+
+    def _on_profile(self, kind: str, report: str):
+        print(f"[ifred] {self.name} {kind} profile of one search:\n{report}")
+
     def _handle_return(self):
         if self.items.model().rowCount():
             action = self.items.currentIndex().data()
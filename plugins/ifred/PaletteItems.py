@@ -1,7 +1,12 @@
+from typing import Optional, Tuple
 from .qt_bindings import *
 
 from .filter import PaletteFilter
-from .utils import loadFile
+from .utils import asset_cache, loadFile
+
+# Rows past the previous one searched for the selected action when results
+# of the same query are refreshed
+RESELECT_SCAN = 10000
 
 class ItemDelegate(QStyledItemDelegate):
     def __init__(self, parent):
@@ -11,6 +16,11 @@ class ItemDelegate(QStyledItemDelegate):
         self.style_updated = False
         self.cached_size = QSize()
         self.updateCSS(loadFile("theme/window.css"))
+        asset_cache.changed.connect(self._on_asset_changed)
+
+    def _on_asset_changed(self, filename):
+        if filename == "theme/window.css":
+            self.updateCSS(loadFile(filename))
 
     def updateCSS(self, style_sheet):
         self.document.setDefaultStyleSheet(style_sheet)
@@ -143,11 +153,37 @@ class PaletteItems(QListView):
         self.setModel(self.model_)
         self.setItemDelegate(self.item_delegate_)
 
+        # (keyword, row, action id) selected before the results were replaced
+        self.selected: Optional[Tuple[str, int, str]] = None
+        self.model_.layoutAboutToBeChanged.connect(self._remember_selection)
         self.model_.filteringDone.connect(self._on_filtering_done)
 
+    def _remember_selection(self):
+        current = self.currentIndex()
+        if current.isValid() and current.row() < self.model_.resultCount():
+            self.selected = (self.model_.filter(), current.row(), current.data().id)
+        else:
+            self.selected = None
+
     def _on_filtering_done(self, index):
         self.item_delegate_.setRecents(index)
-        self.setCurrentIndex(self.model_.index(0, 0))
+        self.setCurrentIndex(self.model_.index(self.reselect(), 0))
+
+    def reselect(self) -> int:
+        """Row to select in new results: the action selected before when the
+        query is the same (a refresh), otherwise the first row"""
+        selected, self.selected = self.selected, None
+        if selected is None:
+            return 0
+        keyword, row, action_id = selected
+        if keyword != self.model_.filter() or row == 0:
+            return 0
+
+        found = self.model_.rowOfId(action_id, row + RESELECT_SCAN)
+        if found < 0:
+            return 0
+        self.model_.fetchTo(found)
+        return found
 
     def model(self):
         return self.model_
@@ -6,3 +6,12 @@ class Action:
     name: str
     shortcut: str = ""
     description: str = ""
+
+    @property
+    def key(self) -> str:
+        """Text searches match and score; spilled actions keep a casefolded one"""
+        return self.name
+
+    @property
+    def folded(self) -> str:
+        return self.name.casefold()
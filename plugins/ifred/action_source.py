@@ -0,0 +1,142 @@
+"""Lazy action sources for `api.show_palette`.
+
+Besides a list of actions, palettes accept sources that are read a chunk at
+a time while the palette is already open:
+
+- any iterable or generator of actions,
+- a chunked callable `fetch(offset, limit)` returning up to `limit` actions
+  from `offset`, and an empty sequence past the end,
+- an `ActionTable` of columns (ids, names, ...) such as arrays.
+
+Items may be `Action`s, `(id, name[, shortcut[, description]])` tuples or
+dicts of Action fields. An `ActionLoader` pulls the chunks from the event
+loop in time slices, as plugins' sources may call IDA's API, and appends
+them to the VersionedList the palette's BasicService searches; open
+palettes refresh as they come in."""
+import itertools
+from dataclasses import dataclass
+from typing import Callable, Dict, Iterable, Iterator, List, Optional, Sequence, Union
+
+from .qt_bindings import *
+from .action import Action
+from .basic_service import SAME_THREAD_THRESHOLD, BasicService
+from .enumeration import Enumerator
+from .versioned import VersionedList
+from . import service_pool
+
+# Actions converted and appended per chunk
+LOAD_CHUNK = 1024
+
+@dataclass
+class ActionTable:
+    """Actions as columns of equal length, converted to Action objects only
+    as they are loaded"""
+    ids: Sequence[str]
+    names: Sequence[str]
+    shortcuts: Optional[Sequence[str]] = None
+    descriptions: Optional[Sequence[str]] = None
+
+    def __len__(self) -> int:
+        return len(self.ids)
+
+    def chunks(self, size: int) -> Iterator[List[Action]]:
+        for start in range(0, len(self.ids), size):
+            end = start + size
+            ids, names = self.ids[start:end], self.names[start:end]
+            if self.shortcuts is None and self.descriptions is None:
+                yield list(map(Action, ids, names))
+            else:
+                shortcuts = itertools.repeat("") if self.shortcuts is None else self.shortcuts[start:end]
+                descriptions = itertools.repeat("") if self.descriptions is None else self.descriptions[start:end]
+                yield list(map(Action, ids, names, shortcuts, descriptions))
+
+LazySource = Union[Iterable, Callable[[int, int], Sequence], ActionTable]
+
+def to_action(item) -> Action:
+    if isinstance(item, Action):
+        return item
+    if isinstance(item, dict):
+        return Action(**item)
+    return Action(*item)
+
+def action_chunks(source, size: int = LOAD_CHUNK) -> Iterator[List[Action]]:
+    """Lists of at most `size` actions read from a lazy source"""
+    if isinstance(source, ActionTable):
+        yield from source.chunks(size)
+    elif callable(source):
+        offset = 0
+        while True:
+            chunk = source(offset, size)
+            if not chunk:
+                break
+            offset += len(chunk)
+            yield [to_action(item) for item in chunk]
+    else:
+        items = iter(source)
+        while True:
+            chunk = [to_action(item) for item in itertools.islice(items, size)]
+            if not chunk:
+                break
+            yield chunk
+
+def size_hint(source) -> Optional[int]:
+    try:
+        return len(source)
+    except TypeError:
+        return None
+
+class ActionLoader(QObject):
+    """Reads a lazy source into `items` from the event loop"""
+    finished = Signal()
+
+    def __init__(self, source, items: VersionedList, parent: QObject = None):
+        super().__init__(parent)
+        self.source = source
+        self.items = items
+        # One chunk per clock check, a chunk takes a while to convert
+        self.enumerator = Enumerator(action_chunks(source), self.extend, parent=self, check_every=1)
+        self.enumerator.finished.connect(self.finished)
+
+    def start(self) -> None:
+        self.enumerator.start()
+
+    def stop(self) -> None:
+        self.enumerator.stop()
+
+    def running(self) -> bool:
+        return self.enumerator.running()
+
+    def extend(self, chunks: List[List[Action]]) -> None:
+        self.items.extend(list(itertools.chain.from_iterable(chunks)))
+
+# Loaders of the palettes shown with lazy sources, by palette name
+_loaders: Dict[str, ActionLoader] = {}
+
+def lazy_service(name: str, source) -> BasicService:
+    """The palette's persistent service, searching what has been read of
+    `source` so far. Showing the palette again with the same source object
+    keeps what was read; another source starts over."""
+    service = service_pool.acquire(name, lambda: BasicService(None, name, VersionedList()))
+    loader = _loaders.get(name)
+    if loader is None or loader.source is not source or service.actions is not loader.items:
+        if loader is not None:
+            loader.stop()
+        loader = _loaders[name] = ActionLoader(source, VersionedList())
+        service.setActions(loader.items)
+        # Search off the GUI thread unless the source is known to stay small
+        hint = size_hint(source)
+        service.expected_size = SAME_THREAD_THRESHOLD if hint is None else hint
+        loader.start()
+    return service
+
+def loader(name: str) -> Optional[ActionLoader]:
+    return _loaders.get(name)
+
+def release(name: str) -> None:
+    loader = _loaders.pop(name, None)
+    if loader is not None:
+        loader.stop()
+
+def release_all() -> None:
+    for name in list(_loaders):
+        release(name)
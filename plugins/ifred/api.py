@@ -1,7 +1,10 @@
-from typing import Callable, List, Optional
+from typing import Callable, List, Optional, Union
 from .qt_bindings import *
 from .action import Action
+from .action_source import ActionTable, LazySource
 from .CommandPalette import CommandPalette
+from .filter import SearchService
+from . import action_source, recents, service_pool
 
 g_current_widget = None
 # Type hint for plugin path handler
@@ -34,8 +37,15 @@ def get_main_window() -> QWidget:
             return widget
     return None
 
-def show_palette(name: str, placeholder: str, actions: List[Action],
+def palette_service(name: str, factory: Callable[[], SearchService]) -> SearchService:
+    """The persistent search service of a palette, created by `factory` on first use"""
+    return service_pool.acquire(name, factory)
+
+def show_palette(name: str, placeholder: str, actions: Union[List[Action], SearchService, LazySource],
                 close_key: str, func: Callable) -> None:
+    """Show a palette of `actions`: a list, a search service, or a lazy source
+    (iterable, `fetch(offset, limit)` callable or ActionTable, see
+    `action_source`) read in the background while the palette is open"""
     def create_palette():
         global g_current_widget
         g_current_widget = CommandPalette(get_main_window())
@@ -46,10 +56,17 @@ def show_palette(name: str, placeholder: str, actions: List[Action],
     # post_to_timer(create_palette, 100)
     create_palette()
 
+def release_palette(name: str) -> None:
+    """Drop the persistent search service of a palette, e.g. when its data goes away"""
+    action_source.release(name)
+    service_pool.release(name)
+
 def cleanup_palettes() -> None:
     # Note: Python doesn't have direct equivalent of Q_CLEANUP_RESOURCE
     # This would need to be handled differently depending on resource management approach
-    pass
+    action_source.release_all()
+    service_pool.release_all()
+    recents.flush_queries()
 
 def set_path_handler(handler: Callable) -> None:
     global pluginPath
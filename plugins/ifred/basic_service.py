@@ -1,138 +1,481 @@
+import itertools
+import math
+import operator
+import sys
+import time
+from array import array
 from .qt_bindings import *
-from typing import List, Dict, Tuple, Optional
+from typing import Callable, List, Dict, Set, Tuple, Optional, Union
 from rapidfuzz import fuzz
 import threading 
 from .action import Action
-from .filter import SearchService
+from .filter import SearchMetrics, SearchService
+from .search_index import SearchIndex, boundaries, segment_match
+from .query import Query, parse_query
+from .utils import load_json
+from .recents import MAX_RECENT_ITEMS, RecentActions
+from .result_cache import CachedResult, EmptyView
+from .spill import SpilledAction
+from .versioned import VersionedList
 from . import fts_fuzzy_match
 
-class CanceledError(Exception):
-    pass
-
-MAX_RECENT_ITEMS = 100
 SAME_THREAD_THRESHOLD = 20000
+# Items processed between staleness checks / event loop slices
+SEARCH_CHUNK = 256
+# Score of segment matches before adding the name length; ratios are in [-100, 0]
+SEGMENT_SCORE = -100000
+# Frecency column value of actions never selected; frecencies are positive
+UNTRACKED = -1.0
+ACTION_ID = operator.attrgetter("id")
+ACTION_NAME = operator.attrgetter("name")
 
-distances: Dict[Tuple[str, str], int] = {}
-def distance(s1: str, s2: str) -> int:
-    # distances = QThreadStorage[Dict[Tuple[str, str], int]]()
-    pair = (s1, s2)
+# Names with a cached distance, across keywords; past this the oldest keywords go
+DISTANCE_CACHE_ENTRIES = 1 << 18
+
+class DistanceCache:
+    """Distances of the last few keywords to the names they were scored
+    against, so a repeated search (prefetch, corpus update) skips fuzz.ratio.
+
+    Bounded: the names it holds may be decoded from a ColdStore, which would
+    otherwise stay resident past the memory budget. Keywords are evicted
+    least recently searched first."""
 
-    # if not distances.hasLocalData():
-    #     distances.setLocalData({})
+    def __init__(self, max_entries: int = DISTANCE_CACHE_ENTRIES):
+        self.max_entries = max_entries
+        self.lock = threading.Lock()
+        self.keywords: Dict[str, Dict[str, int]] = {}
 
-    # distances_map = distances.localData()
-    distances_map = distances
-    if pair in distances_map:
-        return distances_map[pair]
+    def scores(self, text: str) -> Dict[str, int]:
+        """The distances of `text`, to fill while there is `room`"""
+        with self.lock:
+            table = self.keywords.pop(text, None)
+            if table is None:
+                table = {}
+            self.keywords[text] = table
+            return table
 
-    score = 0
-    score = fuzz.ratio(s1, s2)
+    def room(self, table: Dict[str, int]) -> bool:
+        return len(table) < self.max_entries
 
-    distances_map[pair] = -score
-    return -score
+    def trim(self) -> None:
+        with self.lock:
+            total = sum(map(len, self.keywords.values()))
+            while total > self.max_entries and len(self.keywords) > 1:
+                total -= len(self.keywords.pop(next(iter(self.keywords))))
 
-def convert_variant(a) -> int:
-    return int(a)
+    def clear(self) -> None:
+        with self.lock:
+            self.keywords.clear()
 
-def convert_int(a: int) -> int:
-    return a
+    def memory_report(self) -> Dict[str, int]:
+        """Entries and bytes, in the shape of `spill.memory_report`"""
+        with self.lock:
+            tables = list(self.keywords.items())
+        total = sys.getsizeof(self.keywords)
+        for text, table in tables:
+            total += sys.getsizeof(text) + sys.getsizeof(table)
+            total += sum(map(sys.getsizeof, table)) + sum(map(sys.getsizeof, table.values()))
+        return {"rows": sum(len(table) for _, table in tables), "spilled": 0,
+                "resident_bytes": total, "mapped_bytes": 0}
+
+distances = DistanceCache()
+
+def distance(s1: str, s2: str) -> int:
+    return -fuzz.ratio(s1, s2)
 
-def convert_hash(source: Dict[str, any], target_type) -> Dict[str, any]:
-    return {k: convert_variant(v) if target_type == any else convert_int(v)
-            for k, v in source.items()}
+def key_text(text: str, action: Action) -> str:
+    """`text` as compared to the search key of `action`"""
+    return text.lower() if isinstance(action, SpilledAction) else text
+
+def once_per_name(match: Callable[[str], object], shared: Set[str]) -> Callable[[str], bool]:
+    """`match` remembering its verdict on the names in `shared`, which several
+    rows have, so each of them is matched once per search"""
+    if not shared:
+        return match
+    verdicts: Dict[str, bool] = {}
+
+    def remembered(name: str) -> bool:
+        if name not in shared:
+            return match(name)
+        verdict = verdicts.get(name)
+        if verdict is None:
+            verdict = verdicts[name] = bool(match(name))
+        return verdict
+    return remembered
 
 class BasicService(SearchService):
-    def __init__(self, parent: QObject, palette_name: str, actions: List[Action]):
+    def __init__(self, parent: QObject, palette_name: str, actions: Union[List[Action], VersionedList[Action]],
+                 source=None):
         super().__init__(parent)
         self.actions = actions
-        self.storage = QSettings("ifred", palette_name)
+        # NamesManager-like object whose `version` changes with the actions
+        self.source = source
         self.indexes = [0] * len(actions)
-        self.recent_indexes = []
-        self.recent_actions = {}
-        self.canceled = False
+        # Size the actions are expected to grow to, e.g. while a lazy source loads
+        self.expected_size = 0
+        # Child object, so it follows the service onto its worker thread
+        self.recents = RecentActions(palette_name, self)
+        self.recent_indexes = [0] * len(self.recents.scores)
+        self.index: Optional[SearchIndex] = None
+        # Frecency of each row of `column_actions`
+        self.column = array("d")
+        self.column_actions: Optional[List[Action]] = None
+        self.column_key = None
+        self.empty_view = EmptyView(MAX_RECENT_ITEMS)
+        # Results of the palette's frequent queries, searched ahead of time
+        self.prefetched: Dict[str, CachedResult] = {}
+        self.subscribe(actions)
+        # Requeues searches onto the worker once the service has one
+        self.startSearching.connect(self.doSearch)
+
+    def setActions(self, actions: Union[List[Action], VersionedList[Action]]):
+        if actions is self.actions:
+            return
+
+        self.cancel()
+        self.unsubscribe()
+        self.actions = actions
+        self.empty_view.invalidate()
+        self.subscribe(actions)
 
-        self.storage.sync()
-        recent_actions_variant = self.storage.value("recent_actions", {})
-        self.recent_actions = convert_hash(recent_actions_variant, int)
-        self.recent_indexes = [0] * len(self.recent_actions)
+    def subscribe(self, actions) -> None:
+        if isinstance(actions, VersionedList):
+            actions.subscribe(self.onCorpusDelta)
+
+    def unsubscribe(self) -> None:
+        if isinstance(self.actions, VersionedList):
+            self.actions.unsubscribe(self.onCorpusDelta)
+
+    def onCorpusDelta(self, old: Optional[Action], new: Optional[Action]) -> None:
+        # Called by the writer (an IDB hook on the main thread) for every change
+        self.empty_view.record(old, new)
+        if self.watched:
+            self.corpusChanged.emit(old, new, self)
+
+    def evaluate(self, keyword: str, action: Action) -> Optional[float]:
+        query = parse_query(keyword)
+        if query.error:
+            return None
+        if query.scope and action.id.startswith("struct:") != (query.scope == "types"):
+            return None
+
+        name = action.key
+        if query.kind == "prefix":
+            matched = name.casefold().startswith(query.text.casefold())
+        elif query.kind == "exact":
+            matched = name.casefold() == query.text.casefold()
+        elif query.kind == "regex":
+            matched = query.pattern.search(name) is not None
+        else:
+            matched = not query.text or fts_fuzzy_match.fuzzy_match_simple(query.text, name)
+
+        if not matched:
+            return None
+        if not query.scored:
+            # Unranked results keep index order, new ones go last
+            return math.inf
+        offsets = action.boundaries() if isinstance(action, SpilledAction) else boundaries(name)
+        if segment_match(query.text.lower(), name.lower(), offsets):
+            return SEGMENT_SCORE + len(name)
+        return distance(key_text(query.text, action), name)
 
     def handle_item_clicked(self, action: Action):
-        to_remove = []
-        for key in self.recent_actions:
-            self.recent_actions[key] += 1
-            if self.recent_actions[key] >= MAX_RECENT_ITEMS:
-                to_remove.append(key)
+        self.recents.touch(action.id)
+        self.empty_view.touch(action)
+
+    def shutdown(self):
+        self.unsubscribe()
+        self.recents.flush()
+        super().shutdown()
+
+    def corpusSize(self) -> int:
+        return len(self.actions)
+
+    def corpusNames(self):
+        # A generator, so the corpus is taken by whoever reads the names
+        yield from map(ACTION_NAME, self.corpus())
+
+    def corpus(self) -> List[Action]:
+        """Actions a search pins for its duration: a snapshot of a VersionedList,
+        which picks up the latest version, or the list itself"""
+        actions = self.actions
+        return actions.snapshot() if isinstance(actions, VersionedList) else actions
+
+    def corpusVersion(self) -> int:
+        """Changes whenever the actions list is modified in place. Snapshots
+        never are, a new version of a VersionedList is a new list."""
+        if isinstance(self.actions, VersionedList):
+            return 0
+        return getattr(self.source, "version", 0)
+
+    def viewKey(self) -> tuple:
+        """Changes when the empty view can't be patched up to date. Selections
+        are patched in, see `handle_item_clicked`."""
+        return id(self.actions), self.corpusVersion(), (
+            0 if isinstance(self.actions, VersionedList) else len(self.actions))
+
+    def resultKey(self) -> tuple:
+        """Changes whenever cached results may be out of date"""
+        return self.viewKey() + (self.recents.counter, getattr(self.actions, "version", 0))
+
+    def searchIndex(self, actions: List[Action]) -> SearchIndex:
+        version = self.corpusVersion()
+        index = self.index
+        if index is None or not index.matches(actions, version):
+            index = self.index = SearchIndex(actions, version)
+        return index
 
-        for key in to_remove:
-            del self.recent_actions[key]
+    def frecencyColumn(self, actions: List[Action]) -> array:
+        """Frecency of each row of `actions`, UNTRACKED for actions never
+        selected. Rebuilt, a C loop, only when the corpus or a frecency changes."""
+        key = (self.recents.counter, len(actions), self.corpusVersion())
+        if self.column_actions is not actions or self.column_key != key:
+            scores = self.recents.scores
+            if scores:
+                self.column = array("d", map(scores.get, map(ACTION_ID, actions), itertools.repeat(UNTRACKED)))
+            else:
+                self.column = array("d", [UNTRACKED]) * len(actions)
+            self.column_actions = actions
+            self.column_key = key
+        return self.column
 
-        self.recent_actions[action.id] = 0
-        self.storage.setValue("recent_actions",
-                            convert_hash(self.recent_actions, any))
-        self.storage.sync()
+    def pinnedResults(self, keyword: str, actions: List[Action], metrics: SearchMetrics) -> List[Action]:
+        """Results shown ahead of the fuzzy matches, above the separator"""
+        return []
+
+    def candidates(self, query: Query, actions: List[Action], metrics: SearchMetrics):
+        """Rows to scan for `query` and the predicate they must pass (None: all of them)"""
+        if query.error:
+            return (), None
+        match = None
+        if query.kind == "fuzzy" and query.text:
+            text = query.text
+            match = lambda name: fts_fuzzy_match.fuzzy_match_simple(text, name)
+        if query.kind == "fuzzy" and not query.scope:
+            # Plain queries scan everything, no index needed
+            return range(len(actions)), match
+
+        started = time.perf_counter()
+        index = self.searchIndex(actions)
+        if query.kind == "prefix":
+            rows = index.in_scope(index.prefix_rows(query.text), query.scope)
+        elif query.kind == "exact":
+            rows = index.in_scope(index.exact_rows(query.text), query.scope)
+        elif query.scope:
+            rows = index.partition(query.scope)
+        else:
+            rows = range(len(actions))
+
+        if query.kind == "regex":
+            # Patterns can be slow enough to pay for counting the shared names
+            match = once_per_name(query.pattern.search, index.duplicate_names())
+        metrics.add("index", started)
+        return rows, match
 
     def runInSeparateThread(self) -> bool:
-        return len(self.actions) >= SAME_THREAD_THRESHOLD
+        return max(len(self.actions), self.expected_size) >= SAME_THREAD_THRESHOLD
+
+    def doSearch(self, keyword: str, generation: int = 0):
+        if self.isStale(generation) or self.answerCached(keyword, generation):
+            return
+        if self.worker_thread is None and parse_query(keyword).kind == "regex":
+            # A pattern can take arbitrarily long on a single name, which no GUI
+            # thread slice can preempt: search on a worker from now on
+            self.startWorker()
+            self.startSearching.emit(keyword, generation)
+            return
+        self.runSteps(self.searchSteps(keyword, generation), generation)
+
+    def answerCached(self, keyword: str, generation: int) -> bool:
+        """Answer from the empty view or a prefetched result, if there's one"""
+        if self.profile_next:
+            return False
+
+        metrics = self.beginMetrics(keyword, generation)
+        metrics.cached = True
+        started = time.perf_counter()
+        if not keyword:
+            items, recent_count = self.empty_view.get(self.viewKey(), self.corpus, self.recents.scores)
+            highlight = ""
+        else:
+            cached = self.prefetched.get(keyword)
+            if cached is None or cached.key != self.resultKey():
+                return False
+            cached.restoreScores()
+            items, recent_count, highlight = cached.items, cached.recent_count, cached.highlight
+
+        # Palettes modify the rows they are given
+        result = list(items)
+        metrics.candidates = len(result)
+        metrics.add("cached", started)
+
+        started = time.perf_counter()
+        self.resultsReady.emit(highlight, result, recent_count, generation)
+        metrics.add("emit", started)
+        self.publishMetrics(metrics)
+        return True
+
+    def answersInstantly(self, keyword: str) -> bool:
+        cached = self.prefetched.get(keyword)
+        return not keyword or (cached is not None and cached.key == self.resultKey())
+
+    def prefetch(self, keywords: List[str]) -> None:
+        if self.profile_next or self.sliced_steps is not None:
+            # Never take over a search being pumped on the GUI thread
+            return
+        # Any search requested from now on makes the prefetch stale
+        generation = self.generation
+        self.prefetched = {keyword: cached for keyword, cached in self.prefetched.items()
+                           if keyword in keywords}
+        self.runSteps(self.prefetchSteps(keywords, generation), generation)
 
-    def cancel(self):
-        self.canceled = True
+    def prefetchSteps(self, keywords: List[str], generation: int):
+        self.empty_view.get(self.viewKey(), self.corpus, self.recents.scores)
+        for keyword in keywords:
+            yield
+            cached = self.prefetched.get(keyword)
+            if keyword and (cached is None or cached.key != self.resultKey()):
+                yield from self.searchSteps(keyword, generation, publish=False)
 
-    def doSearch(self, keyword: str):
+    def searchSteps(self, keyword: str, generation: int, publish: bool = True):
+        """Search as a generator that yields between chunks of the corpus, so the
+        caller can check staleness and hand control back to the event loop.
+        Results of prefetched keywords are kept; `publish` emits them."""
+        metrics = self.beginMetrics(keyword, generation)
+        key = self.resultKey()
         nonrecent_count = 0
         recent_count = 0
-        recent_actions = dict(self.recent_actions)
-
-        self.canceled = False
-
-        for i in range(len(self.indexes)):
-            if self.canceled:
-                return
-            # TODO profile
-            # if not keyword or fuzz.ratio(keyword, self.actions[i].name) > 20.0:
-            if not keyword or fts_fuzzy_match.fuzzy_match_simple(keyword, self.actions[i].name):
-                if self.actions[i].id in recent_actions:
-                    self.recent_indexes[recent_count] = i
-                    recent_count += 1
-                else:
-                    self.indexes[nonrecent_count] = i
-                    nonrecent_count += 1
-
-        try:
-            def recent_sort_key(idx):
-                if self.canceled:
-                    raise CanceledError()
-                return recent_actions[self.actions[idx].id]
-
-            self.recent_indexes[:recent_count] = sorted(
-                self.recent_indexes[:recent_count],
-                key=recent_sort_key
-            )
-
-            if len(keyword) > 1:
-                for i in range(nonrecent_count):
-                    if self.canceled:
-                        raise CanceledError()
+        actions = self.corpus()
+        column = self.frecencyColumn(actions)
+
+        # The service outlives palette windows, so the corpus may have grown
+        if len(self.indexes) != len(actions):
+            self.indexes = [0] * len(actions)
+        if len(self.recent_indexes) < len(self.recents.scores):
+            self.recent_indexes = [0] * len(self.recents.scores)
+
+        query = parse_query(keyword)
+        pinned = self.pinnedResults(keyword, actions, metrics) if query.kind == "fuzzy" else []
+        pinned_ids = {action.id for action in pinned}
+        if pinned and publish:
+            # Show the precise hits right away, the fuzzy matches follow
+            self.resultsReady.emit(keyword, list(pinned), len(pinned), generation)
+
+        rows, match = self.candidates(query, actions, metrics)
+        deadline = None
+        chunk = SEARCH_CHUNK
+        if query.kind == "regex":
+            timeout_ms = load_json("config.json").get("search", {}).get("regex_timeout_ms", 2000)
+            deadline = time.perf_counter() + timeout_ms / 1000
+            if self.worker_thread is None:
+                # Prefetched on the GUI thread: a slow pattern must not hold up
+                # a slice for a whole chunk
+                chunk = 1
+
+        timed_out = False
+        for start in range(0, len(rows), chunk):
+            started = time.perf_counter()
+            for i in rows[start:start + chunk]:
+                if deadline is not None and time.perf_counter() > deadline:
+                    timed_out = True
+                    break
+                # TODO profile
+                # if not keyword or fuzz.ratio(keyword, actions[i].name) > 20.0:
+                if match is None or match(actions[i].key):
+                    if pinned_ids and actions[i].id in pinned_ids:
+                        continue
+                    if column[i] > UNTRACKED:
+                        self.recent_indexes[recent_count] = i
+                        recent_count += 1
+                    else:
+                        self.indexes[nonrecent_count] = i
+                        nonrecent_count += 1
+            metrics.add("match", started)
+            if timed_out:
+                # Show what matched so far rather than hang on a pathological pattern
+                metrics.phases["timeout"] = 0.0
+                break
+            yield
+
+        metrics.scanned = len(rows)
+        metrics.candidates = len(pinned) + recent_count + nonrecent_count
+
+        started = time.perf_counter()
+        self.recent_indexes[:recent_count] = sorted(
+            self.recent_indexes[:recent_count], key=column.__getitem__, reverse=True)
+        if recent_count > MAX_RECENT_ITEMS:
+            # Less frecent matches are ranked like any other
+            overflow = self.recent_indexes[MAX_RECENT_ITEMS:recent_count]
+            self.indexes[nonrecent_count:nonrecent_count + len(overflow)] = overflow
+            nonrecent_count += len(overflow)
+            recent_count = MAX_RECENT_ITEMS
+            if not query.scored:
+                self.indexes[:nonrecent_count] = sorted(self.indexes[:nonrecent_count])
+        metrics.add("sort", started)
+
+        # Scores of the ranked rows, in result order. Kept apart from the actions,
+        # which an open palette may be showing with the scores of another search.
+        ranked_scores = None
+        if query.scored:
+            text = query.text
+            lowered = text.lower()
+            index = self.searchIndex(actions)
+            cached = distances.scores(text)
+            # Spilled keys are casefolded, so their scores are too
+            cached_folded = distances.scores(lowered) if lowered != text else cached
+            scores = [0] * nonrecent_count
+            for start in range(0, nonrecent_count, SEARCH_CHUNK):
+                started = time.perf_counter()
+                for i in range(start, min(start + SEARCH_CHUNK, nonrecent_count)):
                     idx = self.indexes[i]
-                    self.actions[idx].score = distance(keyword, self.actions[idx].name)
-                def distance_sort_key(idx):
-                    if self.canceled:
-                        raise CanceledError()
-                    return distance(keyword, self.actions[idx].name)
-
-                self.indexes[:nonrecent_count] = sorted(
-                    self.indexes[:nonrecent_count],
-                    # key=distance_sort_key
-                    key=lambda idx: self.actions[idx].score
-                )
-
-        except CanceledError:
-            return
+                    if index.segment_match(idx, lowered):
+                        # Acronym/segment hits ("bsa" -> basic_string::append) rank
+                        # above every ratio score, shorter names first
+                        scores[i] = SEGMENT_SCORE + len(actions[idx].key)
+                        continue
+                    action = actions[idx]
+                    name = action.key
+                    table, against = (cached_folded, lowered) if isinstance(action, SpilledAction) else (cached, text)
+                    score = table.get(name)
+                    if score is None:
+                        score = distance(against, name)
+                        if distances.room(table):
+                            table[name] = score
+                    else:
+                        metrics.cache_hits += 1
+                    scores[i] = score
+                metrics.add("score", started)
+                yield
+
+            distances.trim()
 
-        result = []
+            started = time.perf_counter()
+            order = sorted(range(nonrecent_count), key=scores.__getitem__)
+            self.indexes[:nonrecent_count] = [self.indexes[i] for i in order]
+            ranked_scores = [scores[i] for i in order]
+            metrics.add("sort", started)
+            yield
+
+        started = time.perf_counter()
+        result = list(pinned)
         for i in range(recent_count):
-            result.append(self.actions[self.recent_indexes[i]])
+            result.append(actions[self.recent_indexes[i]])
 
         for i in range(nonrecent_count):
-            result.append(self.actions[self.indexes[i]])
+            result.append(actions[self.indexes[i]])
+
+        if self.isStale(generation):
+            return
 
-        self.doneSearching.emit(keyword, result, recent_count)
+        recent_count += len(pinned)
+        if keyword in self.prefetched or not publish:
+            self.prefetched[keyword] = CachedResult(key, query.highlight, result, recent_count, ranked_scores)
+            result = list(result)
+        if publish:
+            if ranked_scores is not None:
+                for action, score in zip(result[recent_count:], ranked_scores):
+                    action.score = score
+            # The operators are not part of the names, highlight the text only
+            self.resultsReady.emit(query.highlight, result, recent_count, generation)
+            metrics.add("emit", started)
+            self.publishMetrics(metrics)
@@ -0,0 +1,413 @@
+import os, sys
+import argparse
+import json
+import platform
+import time
+import tracemalloc
+from typing import Callable, Dict, List
+
+basedir = os.path.abspath(os.path.dirname(__file__))
+sys.path.append(os.path.abspath(basedir + "/../"))
+os.environ.setdefault("QT_QPA_PLATFORM", "offscreen")
+
+from ifred.qt_bindings import *
+from ifred.action import Action
+from ifred.basic_service import BasicService
+from ifred.name_service import NameSearchService
+from ifred.query import parse_query
+from ifred import fts_fuzzy_match, synthetic
+from ifred.spill import format_report, memory_report, spill
+
+# A search path turns a corpus into a function running one keystroke's search
+# synchronously and returning the number of results.
+SearchPath = Callable[[List[Action]], Callable[[str], int]]
+
+def service_path(service: BasicService) -> Callable[[str], int]:
+    results = []
+    service.resultsReady.connect(lambda keyword, items, recent_count, generation: results.append(len(items)))
+
+    def search(keyword: str) -> int:
+        generation = service.nextGeneration()
+        for _ in service.searchSteps(keyword, generation):
+            pass
+        return results.pop()
+    return search
+
+def basic_path(actions: List[Action]) -> Callable[[str], int]:
+    return service_path(BasicService(None, "<benchmark>", actions))
+
+def name_path(actions: List[Action]) -> Callable[[str], int]:
+    return service_path(NameSearchService(None, "<benchmark>", actions))
+
+def match_path(actions: List[Action]) -> Callable[[str], int]:
+    names = [action.name for action in actions]
+
+    def search(keyword: str) -> int:
+        return sum(1 for name in names if fts_fuzzy_match.fuzzy_match_simple(keyword, name))
+    return search
+
+SEARCH_PATHS: Dict[str, SearchPath] = {
+    "basic": basic_path,
+    "name": name_path,
+    "match": match_path,
+    "spilled": name_path,
+}
+
+# How a path's corpus differs from the synthetic one: "spilled" keeps the
+# names in a memory-mapped ColdStore, as NamesManager does over its budget
+CORPUS_TRANSFORMS: Dict[str, Callable[[List[Action]], List[Action]]] = {
+    "spilled": spill,
+}
+
+def percentile(sorted_values: List[float], p: float) -> float:
+    if not sorted_values:
+        return 0.0
+    rank = min(len(sorted_values) - 1, max(0, int(round(p / 100 * len(sorted_values))) - 1))
+    return sorted_values[rank]
+
+def max_rss_kib() -> int:
+    try:
+        import resource
+    except ImportError:
+        return 0
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # bytes on macOS, KiB elsewhere
+    return rss // 1024 if sys.platform == "darwin" else rss
+
+def replay(search: Callable[[str], int], sequences: List[List[str]]) -> dict:
+    latencies = []
+    results = 0
+    for sequence in sequences:
+        for keyword in sequence:
+            start = time.perf_counter()
+            results += search(keyword)
+            latencies.append((time.perf_counter() - start) * 1000)
+    latencies.sort()
+    return {
+        "keystrokes": len(latencies),
+        "results": results,
+        "total_ms": sum(latencies),
+        "mean_ms": sum(latencies) / max(1, len(latencies)),
+        "p50_ms": percentile(latencies, 50),
+        "p90_ms": percentile(latencies, 90),
+        "p99_ms": percentile(latencies, 99),
+        "max_ms": latencies[-1] if latencies else 0.0,
+    }
+
+def run(paths: List[str], sizes: List[int], sequences: List[List[str]], seed: int, memory: bool) -> List[dict]:
+    rows = []
+    for size in sizes:
+        start = time.perf_counter()
+        corpus = synthetic.ida_corpus(size, seed)
+        build_s = time.perf_counter() - start
+
+        for path in paths:
+            searched = CORPUS_TRANSFORMS[path](corpus) if path in CORPUS_TRANSFORMS else corpus
+            search = SEARCH_PATHS[path](searched)
+            # Warm up caches the way a persistent palette service would be
+            search("")
+
+            stats = replay(search, sequences)
+            if memory:
+                # Separate pass, tracing would distort the latencies above
+                tracemalloc.start()
+                replay(search, sequences)
+                stats["search_peak_kib"] = tracemalloc.get_traced_memory()[1] // 1024
+                tracemalloc.stop()
+                report = memory_report({path: searched})
+                stats.update({key: report[path][key] for key in ("resident_bytes", "mapped_bytes")})
+                print(f"{path:>8} {size:>9} {format_report(report)}", file=sys.stderr)
+
+            stats.update({
+                "path": path,
+                "size": size,
+                "corpus_build_s": build_s,
+                "throughput_items_per_s": size * stats["keystrokes"] / max(1e-9, stats["total_ms"] / 1000),
+                "max_rss_kib": max_rss_kib(),
+            })
+            rows.append(stats)
+            print(f"{path:>8} {size:>9} p50 {stats['p50_ms']:9.2f}ms p90 {stats['p90_ms']:9.2f}ms "
+                  f"p99 {stats['p99_ms']:9.2f}ms max {stats['max_ms']:9.2f}ms "
+                  f"{stats['throughput_items_per_s'] / 1e6:8.2f}M items/s", file=sys.stderr)
+    return rows
+
+def replay_slow_log(paths: List[str], filename: str, seed: int) -> List[dict]:
+    """Rebuild each logged slow search's corpus from its shape and rerun its keyword"""
+    from ifred import slowlog
+
+    rows = []
+    for record in slowlog.read(filename):
+        if "lengths" in record:
+            corpus = synthetic.corpus_from_shape(record, seed)
+        else:
+            corpus = synthetic.ida_corpus(record["corpus"], seed)
+
+        for path in paths:
+            searched = CORPUS_TRANSFORMS[path](corpus) if path in CORPUS_TRANSFORMS else corpus
+            search = SEARCH_PATHS[path](searched)
+            search("")
+            stats = replay(search, [[record["keyword"]]])
+            stats.update({
+                "path": path,
+                "size": len(corpus),
+                "keyword": record["keyword"],
+                "recorded_ms": record["total_ms"],
+                "recorded_phases": record.get("phases", {}),
+            })
+            rows.append(stats)
+            print(f"{path:>8} {len(corpus):>9} {record['keyword']!r}: {stats['max_ms']:9.2f}ms "
+                  f"(logged {record['total_ms']:.2f}ms)", file=sys.stderr)
+    return rows
+
+# Budgets for NamesManager over a fake IDA database, failing the run when
+# exceeded. Per-name budgets scale with the database size. Each is at least
+# twice the worst of several runs at 20k and 100k names, and is checked
+# against the best of NAMES_REPEATS runs, so scheduling noise doesn't fail it.
+NAMES_BUDGETS = {
+    "get_us_per_name": 15.0,
+    "get_bytes_per_name": 600,
+    "rename_us": 30.0,
+    "new_name_us": 30.0,
+    "add_type_us": 50.0,
+    "rebase_us_per_name": 15.0,
+    "get_actions_ms": 50.0,
+}
+NAMES_REPEATS = 3
+
+def timed(func) -> float:
+    start = time.perf_counter()
+    func()
+    return time.perf_counter() - start
+
+def run_names(size: int, seed: int, events: int = 10000) -> dict:
+    """NamesManager end to end: enumerate, rename, add types, rebase and close"""
+    import importlib
+    import random
+    from ifred import fake_ida
+    from ifred.api import set_path_handler
+
+    db = fake_ida.FakeDatabase.generate(size, seed)
+    fake_ida.uninstall()
+    fake_ida.install(db)
+    ida_palettes = importlib.import_module("ifred.ida_palettes")
+    set_path_handler(lambda name: f"{basedir}/res/{name}")
+
+    measured = {"size": size, "names": len(db.nlist), "types": len(db.types)}
+    rng = random.Random(seed)
+
+    # Memory in a separate pass, tracing would distort the timing
+    probe = ida_palettes.NamesManager()
+    tracemalloc.start()
+    probe.get()
+    measured["get_peak_bytes"] = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    probe.unhook()
+    del probe
+
+    mgr = ida_palettes.NamesManager()
+    measured["get_s"] = timed(mgr.get)
+    measured["memory"] = mgr.memory_report()
+    count = len(mgr.names)
+    measured["get_actions_s"] = timed(ida_palettes.get_actions)
+    measured["enumeration"] = {kind: {"items": timings.items, "stages_ms": timings.stages}
+                               for kind, timings in ida_palettes.enumeration_timings.items()}
+
+    renamed = rng.sample(db.nlist, min(events, len(db.nlist)))
+    measured["rename_s"] = timed(lambda: [db.rename(ea, f"renamed_{ea:x}") for ea in renamed])
+    errors = [ea for ea in renamed[:1000] if mgr.names[mgr.address_to_name[ea]].name != f"renamed_{ea:x}"]
+
+    top = db.nlist[-1] + 0x1000
+    measured["new_name_s"] = timed(lambda: [db.rename(top + i * 16, f"new_{i}") for i in range(events)])
+    if len(mgr.names) != count + events:
+        errors.append("new names")
+
+    measured["add_type_s"] = timed(lambda: [db.add_type(f"NewType{i}") for i in range(events // 10)])
+
+    start, end = db.nlist[0], db.nlist[-1] + 1
+    delta = 0x10000000
+    measured["rebase_s"] = timed(lambda: db.move_segments([(start, start + delta, end - start)]))
+    moved = renamed[0] + delta
+    if mgr.names[mgr.address_to_name[moved]].id != hex(moved):
+        errors.append("rebase")
+
+    db.close()
+    if mgr.names or mgr.types:
+        errors.append("ev_term")
+    mgr.unhook()
+
+    measured["errors"] = [str(error) for error in errors[:10]]
+    measured["events"] = events
+    return measured
+
+def observe_names(measured: dict) -> Dict[str, float]:
+    names = max(1, measured["names"] + measured["types"])
+    events = measured["events"]
+    return {
+        "get_us_per_name": measured["get_s"] * 1e6 / names,
+        "get_bytes_per_name": measured["get_peak_bytes"] / names,
+        "rename_us": measured["rename_s"] * 1e6 / events,
+        "new_name_us": measured["new_name_s"] * 1e6 / events,
+        "add_type_us": measured["add_type_s"] * 1e6 / max(1, events // 10),
+        "rebase_us_per_name": measured["rebase_s"] * 1e6 / names,
+        "get_actions_ms": measured["get_actions_s"] * 1000,
+    }
+
+def check_names_budgets(runs: List[dict], budgets: dict) -> List[str]:
+    """Checks the best of `runs` of one size against `budgets`; the first
+    run, with the best values in "observed", is the one reported"""
+    measured = runs[0]
+    observed = [observe_names(run) for run in runs]
+    measured["observed"] = {key: min(run[key] for run in observed) for key in observed[0]}
+
+    failures = [f"{measured['size']}: {key} {value:.2f} > budget {budgets[key]}"
+                for key, value in measured["observed"].items() if key in budgets and value > budgets[key]]
+    errors = dict.fromkeys(error for run in runs for error in run["errors"])
+    failures += [f"{measured['size']}: incorrect result after {error}" for error in errors]
+    return failures
+
+# Query of each kind PaletteFilter patches live, and how to rename a row so it
+# still matches. Unranked kinds keep renamed rows in place.
+LIVE_QUERIES = {
+    "": lambda name: name + "_renamed",
+    "n": lambda name: name + "_renamed",
+    "^na": lambda name: name + "_renamed",
+    '"name2"': str.upper,
+    "/name/": lambda name: name + "_renamed",
+    "name1": lambda name: name + "_renamed",
+}
+
+def wait_until(predicate: Callable[[], bool], timeout_ms: int = 5000) -> bool:
+    deadline = time.perf_counter() + timeout_ms / 1000
+    while not predicate() and time.perf_counter() < deadline:
+        QApplication.processEvents(QEventLoop.AllEvents, 50)
+    return predicate()
+
+def run_live(size: int = 200) -> List[str]:
+    """Renames a shown row under each query kind of LIVE_QUERIES and checks
+    where the open palette puts it"""
+    from ifred.api import set_path_handler
+    from ifred.filter import PaletteFilter
+    from ifred.versioned import VersionedList
+
+    set_path_handler(lambda name: f"{basedir}/res/{name}")
+    failures = []
+    for keyword, rename in LIVE_QUERIES.items():
+        actions = VersionedList([Action(hex(i), f"name{i}") for i in range(size)])
+        service = BasicService(None, "<benchmark live>", actions)
+        model = PaletteFilter(None, "<benchmark live>", service)
+        try:
+            model.setFilter(keyword)
+            if not wait_until(lambda: model.search_started is None and model.shown_items):
+                failures.append(f"live {keyword!r}: no results")
+                continue
+
+            row = min(2, len(model.shown_items) - 1)
+            old = model.shown_items[row]
+            new = Action(old.id, rename(old.name))
+            actions[int(old.id, 16)] = new
+            if not wait_until(lambda: model.rowOf(new) >= 0):
+                failures.append(f"live {keyword!r}: {new.name} not shown")
+            elif parse_query(keyword).scored:
+                scores = [item.score for item in model.shown_items[model.recent_count:]]
+                if scores != sorted(scores):
+                    failures.append(f"live {keyword!r}: {new.name} out of score order")
+            elif model.rowOf(new) != row:
+                failures.append(f"live {keyword!r}: {new.name} moved from row {row} to {model.rowOf(new)}")
+        finally:
+            # /regex/ queries move the service onto a worker
+            service.shutdown()
+            model.deleteLater()
+    return failures
+
+def load_sequences(filename: str) -> List[List[str]]:
+    """Recorded keystrokes: a JSON list of queries (typed one character at a
+    time) or of explicit keyword sequences (to replay backspaces and pastes)"""
+    with open(filename, "r", encoding="utf-8") as f:
+        recorded = json.load(f)
+    if isinstance(recorded, dict):
+        recorded = recorded["sequences"]
+    return [synthetic.keystrokes(item) if isinstance(item, str) else list(item) for item in recorded]
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Headless search benchmark over synthetic IDA-like corpora")
+    parser.add_argument("--sizes", default="10k,100k", help="comma separated corpus sizes, e.g. 10k,100k,1M,5M")
+    parser.add_argument("--paths", default=",".join(SEARCH_PATHS), help="search paths to run: " + ", ".join(SEARCH_PATHS))
+    parser.add_argument("--queries", default=",".join(synthetic.DEFAULT_QUERIES), help="comma separated queries, typed key by key")
+    parser.add_argument("--replay", help="JSON file with recorded keystroke sequences")
+    parser.add_argument("--slow-log", help="replay searches recorded in a slow_searches.jsonl file")
+    parser.add_argument("--names", action="store_true",
+                        help="run NamesManager against a fake IDA database and check NAMES_BUDGETS")
+    parser.add_argument("--budgets", help="JSON file overriding NAMES_BUDGETS")
+    parser.add_argument("--repeat", type=int, default=NAMES_REPEATS,
+                        help="runs of --names per size, the best of them is checked")
+    parser.add_argument("--live", action="store_true",
+                        help="check where an open palette puts renamed rows under each query kind")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--memory", action="store_true", help="trace peak Python memory of each replay (slower)")
+    parser.add_argument("--json", help="write machine-readable results to this file, - for stdout")
+    args = parser.parse_args(argv)
+
+    app = QApplication.instance() or QApplication([])
+
+    sizes = [synthetic.parse_size(size) for size in args.sizes.split(",")]
+    paths = [path for path in args.paths.split(",") if path]
+    for path in paths:
+        if path not in SEARCH_PATHS:
+            parser.error(f"unknown search path {path!r}")
+
+    if args.replay:
+        sequences = load_sequences(args.replay)
+    else:
+        sequences = synthetic.keystroke_sequences(args.queries.split(","))
+
+    failures = []
+    if args.live:
+        failures += run_live()
+        rows = []
+    elif args.names:
+        budgets = dict(NAMES_BUDGETS)
+        if args.budgets:
+            with open(args.budgets, "r", encoding="utf-8") as f:
+                budgets.update(json.load(f))
+        rows = []
+        for size in sizes:
+            runs = [run_names(size, args.seed) for _ in range(max(1, args.repeat))]
+            failures += check_names_budgets(runs, budgets)
+            measured = runs[0]
+            rows.append(measured)
+            print(f"   names {size:>9} " + " ".join(f"{key} {value:.2f}" for key, value in measured["observed"].items()),
+                  file=sys.stderr)
+            print(f"   names {size:>9} {format_report(measured['memory'])}", file=sys.stderr)
+            for kind, timings in measured["enumeration"].items():
+                stages = " ".join(f"{stage} {ms:.1f}" for stage, ms in timings["stages_ms"].items())
+                print(f"   names {size:>9} {kind} {timings['items']:,} items ({stages} ms)", file=sys.stderr)
+    elif args.slow_log:
+        rows = replay_slow_log(paths, args.slow_log, args.seed)
+    else:
+        rows = run(paths, sizes, sequences, args.seed, args.memory)
+
+    report = {
+        "meta": {
+            "python": platform.python_version(),
+            "qt_api": QT_API,
+            "platform": platform.platform(),
+            "seed": args.seed,
+            "sequences": sequences,
+            "time": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        },
+        "results": rows,
+        "failures": failures,
+    }
+
+    if args.json == "-":
+        json.dump(report, sys.stdout, indent=2)
+    elif args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump(report, f, indent=2)
+
+    for failure in failures:
+        print(f"BUDGET EXCEEDED {failure}", file=sys.stderr)
+    return 1 if failures else 0
+
+if __name__ == "__main__":
+    sys.exit(main())
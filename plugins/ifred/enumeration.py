@@ -0,0 +1,132 @@
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass, field
+from typing import Callable, Dict, Iterator, List, Optional
+
+from .qt_bindings import *
+
+# Time spent per event loop turn pulling items from an enumeration
+ENUMERATE_SLICE_MS = 10
+# Items fetched from IDA per batch of a pipelined enumeration
+ENUMERATE_BATCH = 4096
+# Batches extracted but not yet collected; extraction waits for the worker past this
+PIPELINE_DEPTH = 4
+
+@dataclass
+class StageTimings:
+    """Where an enumeration spent its time, stage by stage"""
+    items: int = 0
+    # Milliseconds spent in each stage (extract, process, wait, ...)
+    stages: Dict[str, float] = field(default_factory=dict)
+
+    def add(self, stage: str, started: float) -> None:
+        self.stages[stage] = self.stages.get(stage, 0.0) + (time.perf_counter() - started) * 1000
+
+    def summary(self) -> str:
+        stages = " ".join(f"{stage} {ms:.1f}" for stage, ms in self.stages.items())
+        return f"{self.items:,} items ({stages} ms)"
+
+def pipelined(batches: Iterator[List], process: Callable[[List], List], timings: StageTimings,
+              depth: int = PIPELINE_DEPTH) -> List:
+    """The concatenated `process(batch)` of each batch, in order.
+
+    Batches are produced on the calling thread, which must be the main one
+    when they come from IDA's API, while a worker runs `process`, pure
+    Python such as building Actions, on the batches before. At most `depth`
+    batches are in flight; results are collected as they come, so raw
+    batches don't pile up when the worker is the slower stage. The stages are
+    "extract" on the calling thread, "process" on the worker and "wait" for
+    the worker to catch up."""
+    def timed_process(batch: List) -> List:
+        started = time.perf_counter()
+        result = process(batch)
+        timings.add("process", started)
+        return result
+
+    result = []
+    with ThreadPoolExecutor(max_workers=1, thread_name_prefix="ifred-enumeration") as worker:
+        pending = deque()
+        while True:
+            while pending and (len(pending) >= depth or pending[0].done()):
+                started = time.perf_counter()
+                result += pending.popleft().result()
+                timings.add("wait", started)
+
+            started = time.perf_counter()
+            batch = next(batches, None)
+            timings.add("extract", started)
+            if batch is None:
+                break
+            pending.append(worker.submit(timed_process, batch))
+
+        started = time.perf_counter()
+        while pending:
+            result += pending.popleft().result()
+        timings.add("wait", started)
+
+    timings.items += len(result)
+    return result
+
+class Enumerator(QObject):
+    """Pulls items from an iterator in time-boxed slices from the event loop.
+
+    IDA's API may only be called from the main thread, so large lists (strings,
+    functions) are enumerated here a slice at a time rather than on a worker,
+    keeping the UI responsive while they load. Each slice is handed to `sink`.
+    The clock is checked every `check_every` items; lower it for items that
+    take long to produce, such as whole chunks. A None item ends the slice,
+    so a long step that follows it gets a slice of its own."""
+    finished = Signal()
+
+    def __init__(self, items: Iterator, sink: Callable[[List], None],
+                 slice_ms: float = ENUMERATE_SLICE_MS, parent: QObject = None, check_every: int = 64):
+        super().__init__(parent)
+        self.items: Optional[Iterator] = items
+        self.sink = sink
+        self.slice_ms = slice_ms
+        self.check_every = check_every
+        self.count = 0
+        self.elapsed_ms = 0.0
+
+        self.timer = QTimer(self)
+        self.timer.setSingleShot(True)
+        self.timer.timeout.connect(self.step)
+
+    def start(self) -> None:
+        self.timer.start(0)
+
+    def stop(self) -> None:
+        self.timer.stop()
+        self.items = None
+
+    def running(self) -> bool:
+        return self.items is not None
+
+    def step(self) -> None:
+        if self.items is None:
+            return
+
+        started = time.perf_counter()
+        deadline = started + self.slice_ms / 1000
+        chunk = []
+        done = True
+        for item in self.items:
+            if item is None:
+                done = False
+                break
+            chunk.append(item)
+            if len(chunk) % self.check_every == 0 and time.perf_counter() >= deadline:
+                done = False
+                break
+
+        if chunk:
+            self.count += len(chunk)
+            self.sink(chunk)
+        self.elapsed_ms += (time.perf_counter() - started) * 1000
+
+        if done:
+            self.items = None
+            self.finished.emit()
+        else:
+            self.timer.start(0)
@@ -0,0 +1,331 @@
+"""In-process stand-ins for the IDA modules used by ida_palettes.py.
+
+`install(db)` registers fake `idaapi`, `ida_name`, `ida_kernwin`, ... modules
+backed by a FakeDatabase, so NamesManager, get_actions and the IDB hooks can
+run outside IDA. The database simulates the names list, the demangler, local
+types, functions, string literals, segment moves and rename events, and calls
+hooked IDB_Hooks/IDP_Hooks like IDA does. Timers registered with
+`register_timer` run when `run_timers()` is called."""
+import random
+import sys
+import types
+from typing import Callable, Dict, List, Optional, Tuple
+
+from .synthetic import function_signature, ida_corpus, string_literal
+
+BADADDR = 0xFFFFFFFFFFFFFFFF
+
+class FakeDatabase:
+    def __init__(self, sdk_version: int = 900, input_file: str = "/tmp/fake.exe"):
+        self.sdk_version = sdk_version
+        self.input_file = input_file
+        # ea -> mangled name, in get_nlist_ea order
+        self.names: Dict[int, str] = {}
+        self.nlist: List[int] = []
+        # mangled -> demangled (GN_SHORT) names
+        self.demangled: Dict[str, str] = {}
+        # ordinal -> (name, dstr())
+        self.types: Dict[int, Tuple[str, str]] = {}
+        self.actions: Dict[str, Tuple[str, str, int]] = {}
+        # ea -> prototype ("" when untyped)
+        self.functions: Dict[int, str] = {}
+        # ea -> string literal contents
+        self.strings: Dict[int, str] = {}
+        # EAs of IDA's string list as last built, empty until build_strlist()
+        self.strlist: List[int] = []
+        self.hooks: List[object] = []
+        self.jumps: List[int] = []
+        # register_timer callbacks still scheduled, and auto_is_ok()
+        self.timers: List[Callable[[], int]] = []
+        self.auto_done = True
+
+    @classmethod
+    def generate(cls, count: int, seed: int = 0, **kwargs) -> "FakeDatabase":
+        """Database with about `count` names and types from the synthetic corpus"""
+        db = cls(**kwargs)
+        rng = random.Random(seed)
+        for action in ida_corpus(count, seed):
+            if action.id.startswith("struct:"):
+                db.add_type(action.name.split(" ", 1)[1], action.name, notify=False)
+            else:
+                ea = int(action.id, 16)
+                db.add_name(ea, action.name, notify=False)
+                if action.name.startswith("sub_") or "::" in action.name:
+                    signature = function_signature(rng, action.name) if rng.random() < 0.5 else ""
+                    db.add_function(ea, signature, notify=False)
+        # String literals in a data segment of their own
+        ea = 0x10000000
+        for _ in range(count // 4):
+            ea += rng.randint(4, 0x40)
+            db.add_string(ea, string_literal(rng), notify=False)
+        for i in range(200):
+            db.actions[f"Action{i}"] = (f"~A~ction {i}", f"Ctrl+{i % 10}", 0)
+        db.actions["Window1"] = ("Window 1", "", 0)
+        return db
+
+    @staticmethod
+    def mangle(demangled: str) -> str:
+        if "::" not in demangled:
+            return demangled
+        return "?" + "@".join(reversed(demangled.replace("<", "?$").replace(">", "@").split("::"))) + "@@"
+
+    def add_name(self, ea: int, demangled: str, notify: bool = True) -> None:
+        mangled = self.mangle(demangled)
+        old = self.names.get(ea, "")
+        if ea not in self.names:
+            self.nlist.append(ea)
+            if len(self.nlist) > 1 and self.nlist[-2] > ea:
+                self.nlist.sort()
+        self.names[ea] = mangled
+        self.demangled[mangled] = demangled
+        if notify:
+            self.notify("renamed", ea, mangled, False, old)
+
+    def rename(self, ea: int, demangled: str) -> None:
+        self.add_name(ea, demangled)
+
+    def add_type(self, name: str, dstr: Optional[str] = None, notify: bool = True) -> int:
+        ordinal = len(self.types) + 1
+        self.types[ordinal] = (name, dstr or name)
+        if notify:
+            self.notify("local_types_changed", LTC_ADDED, ordinal, name)
+        return ordinal
+
+    def add_function(self, ea: int, signature: str = "", notify: bool = True) -> None:
+        self.functions[ea] = signature
+        if notify:
+            self.notify("func_added", Func(ea))
+
+    def set_type(self, ea: int, signature: str) -> None:
+        self.functions[ea] = signature
+        self.notify("ti_changed", ea, None, None)
+
+    def delete_function(self, ea: int) -> None:
+        self.notify("deleting_func", Func(ea))
+        del self.functions[ea]
+
+    def add_string(self, ea: int, text: str, notify: bool = True) -> None:
+        self.strings[ea] = text
+        if notify:
+            self.notify("make_data", ea, FF_STRLIT, BADADDR, len(text) + 1)
+
+    def delete_items(self, start: int, end: int) -> None:
+        for ea in [ea for ea in self.strings if start <= ea < end]:
+            del self.strings[ea]
+        self.notify("destroyed_items", start, end, False)
+
+    def move_segments(self, moves: List[Tuple[int, int, int]]) -> None:
+        """Rebase: each move is (from, to, size)"""
+        def relocate(items):
+            relocated = {}
+            for ea, item in items.items():
+                for start, to, size in moves:
+                    if start <= ea < start + size:
+                        ea = ea + to - start
+                        break
+                relocated[ea] = item
+            return relocated
+
+        self.names = relocate(self.names)
+        self.functions = relocate(self.functions)
+        self.strings = relocate(self.strings)
+        self.nlist = sorted(self.names)
+        self.notify("allsegs_moved", [SegmentMove(start, to, size) for start, to, size in moves])
+
+    def close(self) -> None:
+        self.notify("ev_term")
+
+    def run_timers(self) -> None:
+        """Fire every registered timer once, ignoring their intervals. Those
+        returning -1 are unregistered, like in IDA."""
+        self.timers = [callback for callback in list(self.timers) if callback() >= 0]
+
+    def notify(self, event: str, *args) -> None:
+        for hook in list(self.hooks):
+            handler = getattr(hook, event, None)
+            if handler is not None:
+                handler(*args)
+
+class Func:
+    def __init__(self, ea: int):
+        self.start_ea = ea
+
+class StringItem:
+    def __init__(self, db: FakeDatabase, ea: int):
+        self.ea = ea
+        self.length = len(db.strings[ea]) + 1
+        self.strtype = 0
+        self.text = db.strings[ea]
+
+    def __str__(self):
+        return self.text
+
+class string_info_t:
+    def __init__(self):
+        self.ea = BADADDR
+        self.length = 0
+        self.type = 0
+
+class SegmentMove:
+    def __init__(self, start: int, to: int, size: int):
+        self._from = start
+        self.to = to
+        self.size = size
+
+LTC_ADDED, LTC_DELETED, LTC_EDITED, LTC_ALIASED = 1, 2, 3, 4
+FF_STRLIT = 0x50000400
+
+def build_modules(db: FakeDatabase) -> Dict[str, types.ModuleType]:
+    idaapi = types.ModuleType("idaapi")
+    ida_name = types.ModuleType("ida_name")
+    ida_kernwin = types.ModuleType("ida_kernwin")
+    ida_nalt = types.ModuleType("ida_nalt")
+    ida_registry = types.ModuleType("ida_registry")
+    idautils = types.ModuleType("idautils")
+    ida_bytes = types.ModuleType("ida_bytes")
+    ida_strlist = types.ModuleType("ida_strlist")
+
+    class Hooks:
+        def __init__(self, *args):
+            pass
+
+        def hook(self):
+            if self not in db.hooks:
+                db.hooks.append(self)
+            return True
+
+        def unhook(self):
+            if self in db.hooks:
+                db.hooks.remove(self)
+            return True
+
+    class tinfo_t:
+        def __init__(self):
+            self.ordinal = 0
+
+        def get_numbered_type(self, til, ordinal):
+            self.ordinal = ordinal
+            return ordinal in db.types
+
+        def get_named_type(self, til, name):
+            for ordinal, (type_name, _) in db.types.items():
+                if type_name == name:
+                    self.ordinal = ordinal
+                    return True
+            return False
+
+        def dstr(self):
+            return db.types.get(self.ordinal, ("", ""))[1]
+
+        __str__ = dstr
+
+    class plugin_t:
+        pass
+
+    class action_handler_t:
+        def __init__(self):
+            pass
+
+    class action_desc_t:
+        def __init__(self, name, label, handler, shortcut="", tooltip="", *args):
+            self.name, self.label, self.handler, self.shortcut = name, label, handler, shortcut
+
+    def register_action(desc):
+        db.actions[desc.name] = (desc.label, desc.shortcut, 0)
+        return True
+
+    def get_strlist_item(item, index):
+        if not 0 <= index < len(db.strlist) or db.strlist[index] not in db.strings:
+            return False
+        item.ea = db.strlist[index]
+        item.length = len(db.strings[item.ea]) + 1
+        return True
+
+    def get_action_state(name):
+        action = db.actions.get(name)
+        return (action is not None, action[2] if action else 0)
+
+    idaapi.__dict__.update(
+        IDA_SDK_VERSION=db.sdk_version,
+        BADADDR=BADADDR,
+        AST_ENABLE_ALWAYS=0, AST_ENABLE_FOR_IDB=1, AST_ENABLE_FOR_WIDGET=2, AST_ENABLE=3,
+        AST_DISABLE_ALWAYS=4,
+        PLUGIN_FIX=0x80, PLUGIN_HIDE=0x10, PLUGIN_SKIP=0, PLUGIN_KEEP=2,
+        LTC_ADDED=LTC_ADDED, LTC_DELETED=LTC_DELETED, LTC_EDITED=LTC_EDITED, LTC_ALIASED=LTC_ALIASED,
+        IDB_Hooks=Hooks, IDP_Hooks=Hooks, UI_Hooks=Hooks,
+        tinfo_t=tinfo_t, plugin_t=plugin_t,
+        action_handler_t=action_handler_t, action_desc_t=action_desc_t,
+        register_action=register_action,
+        unregister_action=lambda name: db.actions.pop(name, None) is not None,
+        get_registered_actions=lambda: list(db.actions),
+        get_action_state=get_action_state,
+        get_action_label=lambda name: db.actions.get(name, ("",))[0],
+        get_action_shortcut=lambda name: db.actions.get(name, ("", ""))[1],
+        update_action_shortcut=lambda name, shortcut: True,
+        get_nlist_size=lambda: len(db.nlist),
+        get_nlist_ea=lambda i: db.nlist[i] if 0 <= i < len(db.nlist) else BADADDR,
+        get_nlist_name=lambda i: db.names.get(db.nlist[i], ""),
+        get_idati=lambda: None,
+        get_ordinal_count=lambda til=None: len(db.types),
+        get_numbered_type_name=lambda til, ordinal: db.types.get(ordinal, (None,))[0],
+        is_idaq=lambda: True,
+        auto_is_ok=lambda: db.auto_done,
+        register_timer=lambda interval, callback: db.timers.append(callback) or callback,
+        unregister_timer=lambda timer: timer in db.timers and db.timers.remove(timer) is None,
+        get_user_idadir=lambda: "/tmp/fake_idadir",
+        PRTYPE_1LINE=0,
+        print_type=lambda ea, flags: db.functions.get(ea) or None,
+        get_func=lambda ea: Func(ea) if ea in db.functions else None,
+    )
+
+    ida_bytes.__dict__.update(
+        get_flags=lambda ea: FF_STRLIT if ea in db.strings else 0,
+        is_strlit=lambda flags: flags == FF_STRLIT,
+        get_strlit_contents=lambda ea, length, strtype:
+            db.strings[ea].encode("utf-8") if ea in db.strings else None,
+    )
+
+    ida_name.__dict__.update(
+        GN_SHORT=0x40,
+        get_ea_name=lambda ea, flags=0: db.names.get(ea, ""),
+        get_demangled_name=lambda ea, inhibitor=0, demform=0, gtn_flags=0:
+            db.demangled.get(db.names.get(ea, ""), db.names.get(ea)),
+    )
+
+    ida_kernwin.__dict__.update(
+        process_ui_action=lambda name, flags=0: name in db.actions,
+        jumpto=lambda ea, *args: db.jumps.append(ea) or True,
+        open_loctypes_window=lambda ordinal, *args: None,
+        open_structs_window=lambda tid, *args: None,
+        open_enums_window=lambda tid, *args: None,
+        show_wait_box=lambda message: None,
+        hide_wait_box=lambda: None,
+    )
+
+    ida_strlist.__dict__.update(
+        string_info_t=string_info_t,
+        build_strlist=lambda: setattr(db, "strlist", sorted(db.strings)),
+        get_strlist_qty=lambda: len(db.strlist),
+        get_strlist_item=get_strlist_item,
+    )
+
+    ida_nalt.get_input_file_path = lambda: db.input_file
+    ida_nalt.get_str_type = lambda ea: 0
+    ida_registry.reg_update_strlist = lambda *args: None
+    idautils.Names = lambda: ((ea, db.names[ea]) for ea in db.nlist)
+    idautils.Functions = lambda start=None, end=None: iter(sorted(db.functions))
+    idautils.Strings = lambda: [StringItem(db, ea) for ea in sorted(db.strings)]
+
+    return {module.__name__: module for module in
+            (idaapi, ida_name, ida_kernwin, ida_nalt, ida_registry, idautils, ida_bytes, ida_strlist)}
+
+def install(db: FakeDatabase) -> Dict[str, types.ModuleType]:
+    """Register the fake modules; import ifred.ida_palettes afterwards"""
+    modules = build_modules(db)
+    sys.modules.update(modules)
+    return modules
+
+def uninstall() -> None:
+    for name in ("idaapi", "ida_name", "ida_kernwin", "ida_nalt", "ida_registry",
+                 "idautils", "ida_bytes", "ida_strlist", "ifred_plugin", "ifred.ida_palettes"):
+        sys.modules.pop(name, None)
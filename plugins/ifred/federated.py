@@ -0,0 +1,207 @@
+import itertools
+import threading
+import time
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from .qt_bindings import *
+from .action import Action
+from .filter import SearchMetrics, SearchService
+from .query import parse_query
+
+class Source(QObject):
+    """One search service of a FederatedService, running on its own worker.
+
+    Requests and clicks go through signals so they are queued onto the
+    worker; results come back queued onto the GUI thread."""
+    search = Signal(str, int)
+    prefetch = Signal(list)
+    clicked = Signal(Action)
+    profile = Signal(str)
+    # Slow log, metrics and names of a slow federated search to record
+    slowSearch = Signal(object, object, object)
+
+    def __init__(self, federated: "FederatedService", name: str, service: SearchService, quota: int,
+                 gate: Optional[threading.Semaphore]):
+        super().__init__(federated)
+        self.federated = federated
+        self.name = name
+        self.service = service
+        # Results merged per search, after the source's own recent/pinned items
+        self.quota = quota
+        self.generation = 0
+        self.results: Optional[List[Action]] = None
+        self.recent_count = 0
+        self.elapsed_ms = 0.0
+
+        # Owned by the federated service rather than by palette windows
+        service.persistent = True
+        service.worker_gate = gate
+        service.startWorker()
+        self.search.connect(service.doSearch)
+        self.prefetch.connect(service.prefetch)
+        self.clicked.connect(service.handle_item_clicked)
+        self.profile.connect(service.requestProfile)
+        self.slowSearch.connect(service.writeSlowSearch)
+        service.resultsReady.connect(self.onDoneSearching)
+        service.corpusChanged.connect(self.onCorpusChanged)
+        service.profileReady.connect(self.onProfileReady)
+
+    def start(self, keyword: str) -> None:
+        self.generation = self.service.nextGeneration()
+        self.results = None
+        self.recent_count = 0
+        self.search.emit(keyword, self.generation)
+
+    def onDoneSearching(self, keyword: str, items: List[Action], recent_count: int, generation: int) -> None:
+        if generation != self.generation:
+            return
+
+        self.results = items
+        self.recent_count = recent_count
+        self.elapsed_ms = (time.perf_counter() - self.service.requested_at) * 1000
+        self.federated.sourceDone(self, keyword)
+
+    def onProfileReady(self, kind: str, report: str) -> None:
+        self.federated.profileReady.emit(f"{kind} ({self.name})", report)
+
+    def onCorpusChanged(self, old: Optional[Action], new: Optional[Action], service: SearchService) -> None:
+        if new is not None:
+            self.federated.owners[id(new)] = self
+        self.federated.corpusChanged.emit(old, new, service)
+
+class FederatedService(SearchService):
+    """Searches several independent sources (names, types, ...) concurrently.
+
+    Every source has its own service, worker thread and index. Whenever one of
+    them reports, the latest results of all sources are merged again: recent
+    and pinned items first, then up to `quota` results of each source ranked
+    by score. Fast sources show up immediately and slow ones stream in later.
+
+    By default every worker searches at once, so a small source (types)
+    finishes while a large one (names) is still scanning. Searches are pure
+    Python and contend for the GIL, so `parallel` > 0 lets only that many of
+    them run at once, in the order the sources were started, for machines
+    where the GUI thread would starve."""
+
+    def __init__(self, parent: QObject, sources: Iterable[Tuple[str, SearchService, int]], parallel: int = 0):
+        super().__init__(parent)
+        gate = threading.Semaphore(parallel) if parallel > 0 else None
+        self.sources: List[Source] = [Source(self, name, service, quota, gate)
+                                      for name, service, quota in sources]
+        self.by_name: Dict[str, Source] = {source.name: source for source in self.sources}
+        # Source that produced each shown action, to route clicks back to it.
+        # Keyed by object, as sources may share ids (a function and its name).
+        self.owners: Dict[int, Source] = {}
+        self.scored = False
+        self.search_generation = 0
+        self.search_started = 0.0
+        self.metrics = None
+
+    def source(self, name: str) -> SearchService:
+        return self.by_name[name].service
+
+    def sourceNames(self) -> List[str]:
+        return [source.name for source in self.sources]
+
+    def requestProfile(self, kind: str) -> None:
+        # Merging isn't worth profiling, each source profiles its own search
+        for source in self.sources:
+            source.profile.emit(kind)
+
+    def doSearch(self, keyword: str, generation: int = 0):
+        self.search_generation = generation
+        self.search_started = time.perf_counter()
+        self.scored = parse_query(keyword).scored
+        self.metrics = self.beginMetrics(keyword, generation)
+        for source in self.sources:
+            source.start(keyword)
+
+    def sourceDone(self, source: Source, keyword: str) -> None:
+        if self.isStale(self.search_generation):
+            return
+
+        started = time.perf_counter()
+        result, recent_count = self.merge()
+        self.resultsReady.emit(keyword, result, recent_count, self.search_generation)
+
+        metrics = self.metrics
+        metrics.sources[source.name] = source.elapsed_ms
+        metrics.add("merge", started)
+        if all(source.results is not None for source in self.sources):
+            metrics.elapsed_ms = (time.perf_counter() - self.search_started) * 1000
+            metrics.scanned = sum(source.service.last_metrics.scanned for source in self.sources
+                                  if source.service.last_metrics is not None)
+            metrics.candidates = len(result)
+            metrics.cached = all(source.service.last_metrics is not None and source.service.last_metrics.cached
+                                 for source in self.sources)
+            self.publishMetrics(metrics)
+
+    def merge(self) -> Tuple[List[Action], int]:
+        top = []
+        ranked = []
+        owners = {}
+        # Sources may overlap, e.g. an untyped function is listed as its name
+        seen = set()
+        for source in self.sources:
+            if source.results is None:
+                continue
+            for action in source.results[:source.recent_count]:
+                key = (action.id, action.folded)
+                if key in seen:
+                    continue
+                seen.add(key)
+                owners[id(action)] = source
+                top.append(action)
+            for rank, action in enumerate(source.results[source.recent_count:source.recent_count + source.quota]):
+                key = (action.id, action.folded)
+                if key in seen:
+                    continue
+                seen.add(key)
+                owners[id(action)] = source
+                # Scores only mean something for scored queries; otherwise interleave by rank
+                ranked.append((getattr(action, "score", 0) if self.scored else 0, rank, action))
+
+        ranked.sort(key=lambda entry: entry[:2])
+        self.owners = owners
+        return top + [action for _, _, action in ranked], len(top)
+
+    def handle_item_clicked(self, action: Action):
+        source = self.owners.get(id(action))
+        if source is not None:
+            source.clicked.emit(action)
+
+    def corpusSize(self) -> int:
+        return sum(source.service.corpusSize() for source in self.sources)
+
+    def corpusNames(self):
+        return itertools.chain.from_iterable(source.service.corpusNames() for source in self.sources)
+
+    def logSlowSearch(self, metrics: SearchMetrics) -> None:
+        # Walking every corpus for its shape is left to a source's worker
+        self.sources[0].slowSearch.emit(self.slow_log, metrics, self.corpusNames())
+
+    def answersInstantly(self, keyword: str) -> bool:
+        return any(source.service.answersInstantly(keyword) for source in self.sources)
+
+    def runInSeparateThread(self) -> bool:
+        # Merging is cheap, the sources do the searching on their own workers
+        return False
+
+    def prefetch(self, keywords: List[str]) -> None:
+        for source in self.sources:
+            source.prefetch.emit(keywords)
+
+    def setWatched(self, watched: bool) -> None:
+        super().setWatched(watched)
+        for source in self.sources:
+            source.service.setWatched(watched)
+
+    def cancel(self) -> None:
+        super().cancel()
+        for source in self.sources:
+            source.service.cancel()
+
+    def shutdown(self) -> None:
+        super().shutdown()
+        for source in self.sources:
+            source.service.shutdown()
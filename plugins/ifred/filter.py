@@ -1,64 +1,140 @@
+import itertools
+import math
+import operator
+import threading
+import time
 from .qt_bindings import *
-from typing import List, Optional
-from dataclasses import dataclass
+from typing import Dict, Iterable, Iterator, List, Optional, Tuple
+from dataclasses import dataclass, field
 
 from .action import Action
+from .utils import load_json
+from .recents import RecentQueries
+from . import profiling, slowlog
+
+# Corpus changes applied to the shown rows one by one; larger batches re-search
+LIVE_REFRESH_LIMIT = 64
+# Corpus changes arriving within this many milliseconds are applied together
+LIVE_REFRESH_DELAY_MS = 100
+# Minimum time between re-searches caused by bulk changes, e.g. while a list loads
+LIVE_RESEARCH_INTERVAL_MS = 1000
+# Past this many shown rows corpus changes re-search instead, as each change
+# renumbers the rows after it
+LIVE_PATCH_ROWS = 10000
+# Rows exposed to the view at first and per fetchMore. List views lay out every
+# row they know of, calling back into the model for each one.
+FETCH_BATCH = 1000
 
 class PaletteFilter(QAbstractItemModel):
-    startSearching = Signal(str)
+    startSearching = Signal(str, int)
+    prefetchRequested = Signal(list)
     item_clicked = Signal(Action)
     filteringDone = Signal(int)  # Signal for when filtering is complete
 
     def __init__(self, parent: QWidget, palette_name: str, search_service: 'SearchService'):
         super().__init__(parent)
         self.shown_items: List[Action] = []
+        # Leading rows of shown_items the view knows about
+        self.fetched = 0
         self.keyword: str = ""
-        self.worker_thread = QThread(self)
         self.search_service = search_service
         self.timer = QTimer()
         self.timer.setSingleShot(True)
-
+        self.timer.timeout.connect(self._start_search)
+        self.pending_keyword = ""
+        self.first_query = True
+        self.search_started: Optional[float] = None
+        # Generation of the last search requested by this model
+        self.generation = 0
+        # Rows above the separator (pinned and recent items)
+        self.recent_count = 0
+        self.pending_changes: List[Tuple[Optional[Action], Optional[Action], "SearchService"]] = []
+        # Row of each shown action, keyed by object; built on the first change
+        self.rows: Optional[Dict[int, int]] = None
+        # Too much changed to follow row by row, search again
+        self.refresh_all = False
+        self.researched_at = 0.0
+        self.refresh_timer = QTimer(self)
+        self.refresh_timer.setSingleShot(True)
+        self.refresh_timer.timeout.connect(self.applyChanges)
+        # Frequent queries of this palette are prefetched once it goes idle
+        self.recent_queries = RecentQueries.for_palette(palette_name)
+        self.prefetch_timer = QTimer(self)
+        self.prefetch_timer.setSingleShot(True)
+        self.prefetch_timer.timeout.connect(self.requestPrefetch)
 
         if self.search_service.runInSeparateThread():
-            self.worker_thread.destroyed.connect(self.search_service.deleteLater)
-            self.search_service.setParent(None)
-            self.search_service.moveToThread(self.worker_thread)
-            # XXX PyQt5 differ from PySide6 and native Qt
-
-            self.worker_thread.start()
-        else:
+            # The worker thread belongs to the service, so a persistent service
+            # keeps it warm across palette windows.
+            self.search_service.startWorker()
+        elif not self.search_service.persistent:
             self.search_service.setParent(self)
 
+        # Opt-in log of slow searches, configured here on the GUI thread
+        self.search_service.setSlowLog(slowlog.from_config(palette_name))
+
         # Connect signals and slots with `search_service`
         self.startSearching.connect(self.search_service.doSearch)
+        self.prefetchRequested.connect(self.search_service.prefetch)
         self.item_clicked.connect(self.search_service.handle_item_clicked)
-        self.search_service.doneSearching.connect(self.onDoneSearching)
+        self.search_service.resultsReady.connect(self.onDoneSearching)
+        self.search_service.doneSearching.connect(self.onLegacyDoneSearching)
+        self.search_service.metricsReady.connect(self.onSearchCompleted)
+        self.search_service.corpusChanged.connect(self.onCorpusChanged)
+        self.search_service.setWatched(True)
 
         # NOTE self is a QObject now, so can't find instance method
+        # Qt drops the connections to this model when it is destroyed, which
+        # detaches a persistent service so the next window can attach to it.
+        service = self.search_service
+        recent_queries = self.recent_queries
         def onDestroy():
-            self.search_service.cancel()
-            self.worker_thread.quit()
-            self.worker_thread.wait()
+            recent_queries.flush()
+            service.setWatched(False)
+            service.cancel()
+            if not service.persistent:
+                service.shutdown()
         # self.destroyed.connect(self.onDestroy)
         self.destroyed.connect(onDestroy)
 
     def setFilter(self, keyword: str) -> None:
         if self.timer.isActive():
             self.timer.stop()
-        
-        # Safely disconnect previous connections to avoid accumulation
-        try:
-            self.timer.timeout.disconnect()
-        except TypeError:
-            # No connections exist yet, which is fine
-            pass
-        
-        # Capture keyword in closure (not lambda parameter)
-        self.timer.timeout.connect(lambda: (
-            self.search_service.cancel(),
-            self.startSearching.emit(keyword)
-        ))
-        self.timer.start(300)  # 300ms delay for debouncing
+        self.prefetch_timer.stop()
+
+        self.pending_keyword = keyword
+        delay = self.debounceDelay()
+        self.first_query = False
+
+        if delay <= 0:
+            self._start_search()
+        else:
+            self.timer.start(delay)
+
+    def debounceDelay(self) -> int:
+        """Debounce proportional to how long searches on this palette take"""
+        config = load_json("config.json").get("debounce", {})
+        if self.first_query and config.get("immediate_first_query", True):
+            return 0
+        if self.search_service.answersInstantly(self.pending_keyword):
+            return 0
+
+        estimate = self.search_service.latency_ms
+        if estimate is None:
+            # Nothing measured yet, guess from the corpus size
+            estimate = self.search_service.corpusSize() * config.get("estimated_ms_per_item", 0.004)
+
+        if estimate < config.get("frame_ms", 16):
+            return 0
+
+        delay = estimate * config.get("latency_factor", 1.0)
+        return int(min(max(delay, config.get("min_ms", 50)), config.get("max_ms", 500)))
+
+    def _start_search(self) -> None:
+        # Taking a new generation cancels every search issued before it
+        self.generation = self.search_service.nextGeneration()
+        self.search_started = time.perf_counter()
+        self.startSearching.emit(self.pending_keyword, self.generation)
 
     def filter(self) -> str:
         return self.keyword
@@ -83,33 +159,458 @@ class PaletteFilter(QAbstractItemModel):
         return 1
 
     def rowCount(self, parent: QModelIndex = QModelIndex()) -> int:
+        return self.fetched
+
+    def canFetchMore(self, parent: QModelIndex = QModelIndex()) -> bool:
+        return self.fetched < len(self.shown_items)
+
+    def fetchMore(self, parent: QModelIndex = QModelIndex()) -> None:
+        self.fetchTo(self.fetched)
+
+    def fetchTo(self, row: int) -> None:
+        """Let the view know about the rows up to `row`, whole batches at a time"""
+        end = min(len(self.shown_items), (row // FETCH_BATCH + 1) * FETCH_BATCH)
+        if end <= self.fetched:
+            return
+        self.beginInsertRows(QModelIndex(), self.fetched, end - 1)
+        self.fetched = end
+        self.endInsertRows()
+
+    def resultCount(self) -> int:
+        """Rows of the results, fetched or not"""
         return len(self.shown_items)
 
+    def rowOfId(self, action_id: str, limit: int) -> int:
+        """Row of the action with `action_id` among the first `limit` rows, or -1"""
+        ids = map(operator.attrgetter("id"), itertools.islice(self.shown_items, limit))
+        try:
+            return operator.indexOf(ids, action_id)
+        except ValueError:
+            return -1
+
     def handle_item_clicked(self, action):
+        self.recent_queries.record(self.pending_keyword)
         self.item_clicked.emit(action)
 
-    def onDoneSearching(self, keyword: str, items: List[Action], recent_count: int) -> None:
+    def requestPrefetch(self) -> None:
+        config = load_json("config.json").get("search", {})
+        keywords = [keyword for keyword in self.recent_queries.frequent(config.get("prefetch_queries", 5))
+                    if keyword != self.pending_keyword]
+        if keywords:
+            self.prefetchRequested.emit(keywords)
+
+    def onDoneSearching(self, keyword: str, items: List[Action], recent_count: int, generation: int) -> None:
+        if generation != self.generation:
+            # Results of a search superseded after it was queued
+            return
+
         self.layoutAboutToBeChanged.emit()
         self.shown_items = items
+        self.rows = None
+        self.fetched = min(len(items), FETCH_BATCH)
         self.keyword = keyword
+        self.recent_count = recent_count
         self.layoutChanged.emit()
         self.filteringDone.emit(recent_count)
 
+    def onLegacyDoneSearching(self, keyword: str, items: List[Action], recent_count: int) -> None:
+        # Such services don't publish metrics either
+        self.search_started = None
+        self.onDoneSearching(keyword, items, recent_count, self.generation)
+
+    def onSearchCompleted(self, metrics: "SearchMetrics") -> None:
+        if metrics.generation != self.generation or self.search_started is None:
+            return
+
+        # Answers that didn't search would pull the debounce towards zero
+        if not metrics.cached:
+            self.search_service.recordLatency((time.perf_counter() - self.search_started) * 1000)
+        self.search_started = None
+
+        # Only once every source has reported, so prefetching doesn't compete with them
+        idle_ms = load_json("config.json").get("search", {}).get("prefetch_idle_ms", 300)
+        if idle_ms >= 0 and not self.timer.isActive() and not self.refresh_timer.isActive():
+            self.prefetch_timer.start(idle_ms)
+
+    def onCorpusChanged(self, old: Optional[Action], new: Optional[Action], service: "SearchService") -> None:
+        if not self.refresh_all:
+            if ((old is None and new is None) or len(self.pending_changes) >= LIVE_REFRESH_LIMIT
+                    or len(self.shown_items) > LIVE_PATCH_ROWS):
+                self.refresh_all = True
+                self.pending_changes = []
+            else:
+                self.pending_changes.append((old, new, service))
+
+        if not self.refresh_timer.isActive():
+            self.refresh_timer.start(LIVE_REFRESH_DELAY_MS)
+
+    def applyChanges(self) -> None:
+        """Bring the shown rows up to date with corpus changes, row by row"""
+        if self.timer.isActive() or self.search_started is not None:
+            # The search on its way may have started before these changes, look
+            # at them again once it's done
+            self.refresh_timer.start(LIVE_REFRESH_DELAY_MS)
+            return
+
+        if self.refresh_all:
+            wait_ms = LIVE_RESEARCH_INTERVAL_MS - (time.perf_counter() - self.researched_at) * 1000
+            if wait_ms > 0:
+                self.refresh_timer.start(int(wait_ms))
+                return
+            self.refresh_all = False
+            self.researched_at = time.perf_counter()
+            self._start_search()
+            return
+
+        changes, self.pending_changes = self.pending_changes, []
+        # Evaluated on the GUI thread: past the time a search may take (a slow
+        # /regex/), search again on the service's worker instead
+        timeout_ms = load_json("config.json").get("search", {}).get("regex_timeout_ms", 2000)
+        deadline = time.perf_counter() + timeout_ms / 1000
+        for old, new, service in changes:
+            if time.perf_counter() > deadline:
+                self.refresh_all = True
+                self.refresh_timer.start(LIVE_REFRESH_DELAY_MS)
+                return
+            self.applyChange(old, new, service)
+
+    def rowOf(self, action: Action) -> int:
+        if self.rows is None:
+            self.rows = dict(zip(map(id, self.shown_items), itertools.count()))
+        return self.rows.get(id(action), -1)
+
+    def renumber(self, start: int, end: Optional[int] = None) -> None:
+        """Update `rows` for the shown rows from `start` to `end`, which moved"""
+        if self.rows is not None:
+            self.rows.update(zip(map(id, self.shown_items[start:end]), itertools.count(start)))
+
+    def insertPosition(self, score: float) -> int:
+        """Row among the scored rows, below the separator, where `score` belongs"""
+        items = self.shown_items
+        low, high = self.recent_count, len(items)
+        while low < high:
+            middle = (low + high) // 2
+            if getattr(items[middle], "score", 0) <= score:
+                low = middle + 1
+            else:
+                high = middle
+        return low
+
+    def applyChange(self, old: Optional[Action], new: Optional[Action], service: "SearchService") -> None:
+        row = self.rowOf(old) if old is not None else -1
+        if new is not None and self.rowOf(new) >= 0:
+            # A search already picked up the change
+            if row >= 0:
+                self.dropRow(row)
+            return
+        if new is not None and 0 <= row < self.recent_count:
+            # Pinned and recent rows stay where they are
+            self.replaceRow(row, new)
+            return
+
+        score = service.evaluate(self.pending_keyword, new) if new is not None else None
+        if score is None:
+            if row >= 0:
+                self.dropRow(row)
+            return
+
+        if score == math.inf:
+            # Unranked results keep corpus order: renamed rows stay put, new ones go last
+            if row >= 0:
+                self.replaceRow(row, new)
+            else:
+                self.insertRow_(len(self.shown_items), new)
+            return
+
+        new.score = score
+        if row < 0:
+            self.insertRow_(self.insertPosition(score), new)
+            return
+
+        # Row of `new` once `old` is out of the way
+        target = self.insertPosition(score)
+        if target > row:
+            target -= 1
+        if target == row:
+            self.replaceRow(row, new)
+            return
+
+        if row >= self.fetched or target >= self.fetched:
+            # Moving from or to rows the view doesn't know about yet
+            self.dropRow(row)
+            self.insertRow_(target, new)
+            return
+
+        # beginMoveRows takes the destination before the move
+        if self.beginMoveRows(QModelIndex(), row, row, QModelIndex(), target if target < row else target + 1):
+            del self.shown_items[row]
+            self.shown_items.insert(target, new)
+            self.forget(old)
+            self.renumber(min(row, target), max(row, target) + 1)
+            self.endMoveRows()
+            self.replaceRow(target, new)
+
+    def insertRow_(self, row: int, action: Action) -> None:
+        if row < self.fetched or self.fetched == len(self.shown_items):
+            self.beginInsertRows(QModelIndex(), row, row)
+            self.shown_items.insert(row, action)
+            self.renumber(row)
+            self.fetched += 1
+            self.endInsertRows()
+        else:
+            self.shown_items.insert(row, action)
+            self.renumber(row)
+
+    def dropRow(self, row: int) -> None:
+        if row < self.recent_count:
+            self.recent_count -= 1
+        self.forget(self.shown_items[row])
+        if row < self.fetched:
+            self.beginRemoveRows(QModelIndex(), row, row)
+            del self.shown_items[row]
+            self.renumber(row)
+            self.fetched -= 1
+            self.endRemoveRows()
+        else:
+            del self.shown_items[row]
+            self.renumber(row)
+
+    def forget(self, action: Action) -> None:
+        if self.rows is not None:
+            self.rows.pop(id(action), None)
+
+    def replaceRow(self, row: int, action: Action) -> None:
+        if self.shown_items[row] is not action:
+            self.forget(self.shown_items[row])
+            if self.rows is not None:
+                self.rows[id(action)] = row
+        self.shown_items[row] = action
+        if row < self.fetched:
+            index = self.index(row, 0)
+            self.dataChanged.emit(index, index)
+
+
+@dataclass
+class SearchMetrics:
+    keyword: str
+    generation: int
+    corpus: int = 0
+    scanned: int = 0
+    candidates: int = 0
+    cache_hits: int = 0
+    # From the request leaving PaletteFilter to the service starting on it
+    queue_wait_ms: float = 0.0
+    # Milliseconds spent in each phase (match, score, sort, emit, ...)
+    phases: Dict[str, float] = field(default_factory=dict)
+    # Answered from a cache without searching, so not a latency sample
+    cached: bool = False
+    # Wall time of each source of a federated search, from the request to its
+    # results. Sources wait for each other, so these overlap and aren't phases.
+    sources: Dict[str, float] = field(default_factory=dict)
+    # Wall time of the whole search, when its phases don't add up to it
+    elapsed_ms: Optional[float] = None
+
+    def add(self, phase: str, started: float) -> None:
+        """Account the time since `started` (a perf_counter value) to `phase`"""
+        self.phases[phase] = self.phases.get(phase, 0.0) + (time.perf_counter() - started) * 1000
+
+    @property
+    def total_ms(self) -> float:
+        if self.elapsed_ms is not None:
+            return self.elapsed_ms
+        return sum(self.phases.values())
+
+    def summary(self) -> str:
+        phases = " ".join(f"{phase} {ms:.1f}" for phase, ms in self.phases.items())
+        sources = "".join(f" {source} {ms:.1f}" for source, ms in self.sources.items())
+        return (f"{self.candidates:,}/{self.scanned:,} matched in {self.total_ms:.1f} ms "
+                f"({phases}{';' if sources else ''}{sources}) wait {self.queue_wait_ms:.1f} ms, "
+                f"{self.cache_hits:,} cached")
 
 class SearchService(QObject):
-    startSearching = Signal(str)  # Signal for search request
+    startSearching = Signal(str, int)  # Signal for search request (keyword, generation)
     itemClicked = Signal(str)     # Signal for item selection
-    doneSearching = Signal(str, list, int)  # Signal for search completion
+    # Signal for search completion (keyword, results, recent_count, generation).
+    # The results are passed as an object, a `list` argument would be converted
+    # item by item on every emit; receivers own the list they're given.
+    resultsReady = Signal(str, object, int, int)
+    # Search completion as services emitted it before searches had generations,
+    # still accepted from them: the results are taken as the latest search's
+    doneSearching = Signal(str, object, int)
+    metricsReady = Signal(object)  # SearchMetrics of each completed search
+    profileReady = Signal(str, str)  # Profiling kind and report of one search
+    # An action of the corpus was replaced, added (old is None) or removed (new is
+    # None); the service is the one that can `evaluate` it. (None, None, service)
+    # means too much changed to follow.
+    corpusChanged = Signal(object, object, object)
 
     def __init__(self, parent: QObject):
         super().__init__(parent)
+        self.worker_thread: Optional[QThread] = None
+        # Persistent services are owned by `service_pool` and outlive palette windows
+        self.persistent = False
+        # Smoothed latency of completed, uncached searches in milliseconds,
+        # measured by PaletteFilter
+        self.latency_ms: Optional[float] = None
+        # Latest requested search; anything older is stale. Written from the
+        # GUI thread, read by the search between chunks.
+        self.generation = 0
+        self.slice_timer: Optional[QTimer] = None
+        self.sliced_steps: Optional[Iterator] = None
+        self.sliced_generation = 0
+        self.requested_at = 0.0
+        self.last_metrics: Optional[SearchMetrics] = None
+        # Profiling kind for the next search, see `profiling.PROFILE_KINDS`
+        self.profile_next = ""
+        self.slow_log: Optional[slowlog.SlowSearchLog] = None
+        # Semaphore shared by workers that shouldn't all search at once
+        self.worker_gate: Optional[threading.Semaphore] = None
+        # Whether a palette shows this service's results, so corpus changes are worth reporting
+        self.watched = False
 
-    def search(self, keyword: str) -> None:
+    def nextGeneration(self) -> int:
+        self.requested_at = time.perf_counter()
+        self.generation += 1
+        return self.generation
+
+    def requestProfile(self, kind: str) -> None:
+        self.profile_next = kind
+
+    def beginMetrics(self, keyword: str, generation: int) -> SearchMetrics:
+        metrics = SearchMetrics(keyword, generation, self.corpusSize())
+        if generation == self.generation:
+            metrics.queue_wait_ms = (time.perf_counter() - self.requested_at) * 1000
+        return metrics
+
+    def publishMetrics(self, metrics: SearchMetrics) -> None:
+        self.last_metrics = metrics
+        self.metricsReady.emit(metrics)
+        if self.slow_log is not None and self.slow_log.isSlow(metrics):
+            self.logSlowSearch(metrics)
+
+    def logSlowSearch(self, metrics: SearchMetrics) -> None:
+        """Write a slow search and the shape of the corpus to the slow log"""
+        self.writeSlowSearch(self.slow_log, metrics, self.corpusNames())
+
+    def writeSlowSearch(self, slow_log: slowlog.SlowSearchLog, metrics: SearchMetrics, names: Iterable[str]) -> None:
+        slow_log.record(metrics, names)
+
+    def setSlowLog(self, slow_log: Optional[slowlog.SlowSearchLog]) -> None:
+        self.slow_log = slow_log
+
+    def isStale(self, generation: int) -> bool:
+        return generation != self.generation
+
+    def runSteps(self, steps: Iterator, generation: int) -> None:
+        """Drive a search generator. A worker thread runs it to the end; on the GUI
+        thread it is pumped in time slices from the event loop so typing never blocks."""
+        if self.profile_next:
+            # Profiled searches run in one go, so the capture covers exactly one search
+            kind, self.profile_next = self.profile_next, ""
+            report = profiling.capture(kind, lambda: [None for _ in steps])
+            self.profileReady.emit(kind, report)
+            return
+
+        if self.worker_thread is not None:
+            if self.worker_gate is not None:
+                self.worker_gate.acquire()
+            try:
+                for _ in steps:
+                    if self.isStale(generation):
+                        return
+            finally:
+                if self.worker_gate is not None:
+                    self.worker_gate.release()
+            return
+
+        if self.slice_timer is None:
+            self.slice_timer = QTimer(self)
+            self.slice_timer.setSingleShot(True)
+            self.slice_timer.timeout.connect(self._pumpSteps)
+
+        self.sliced_steps = steps
+        self.sliced_generation = generation
+        self._pumpSteps()
+
+    def _pumpSteps(self) -> None:
+        steps = self.sliced_steps
+        if steps is None:
+            return
+
+        slice_ms = load_json("config.json").get("search", {}).get("slice_ms", 8)
+        deadline = time.perf_counter() + slice_ms / 1000
+
+        for _ in steps:
+            if self.isStale(self.sliced_generation) or steps is not self.sliced_steps:
+                return
+            if time.perf_counter() >= deadline:
+                self.slice_timer.start(0)
+                return
+
+        if steps is self.sliced_steps:
+            self.sliced_steps = None
+
+    def recordLatency(self, ms: float) -> None:
+        if self.latency_ms is None:
+            self.latency_ms = ms
+        else:
+            self.latency_ms += (ms - self.latency_ms) * 0.3
+
+    def corpusSize(self) -> int:
+        return 0
+
+    def answersInstantly(self, keyword: str) -> bool:
+        """Whether the first results for `keyword` come from an index, so the
+        search shouldn't be debounced"""
+        return False
+
+    def setWatched(self, watched: bool) -> None:
+        self.watched = watched
+
+    def prefetch(self, keywords: List[str]) -> None:
+        """Search `keywords` while the palette is idle and keep the results,
+        so they are answered at once while the corpus stays the same"""
+        pass
+
+    def evaluate(self, keyword: str, action: Action) -> Optional[float]:
+        """Score of a single action for `keyword` as the search would rank it,
+        None if it doesn't match or the service can't tell"""
+        return None
+
+    def corpusNames(self) -> Iterable[str]:
+        """Names searched by this service, for slow search snapshots. Read
+        lazily, possibly on another thread."""
+        return ()
+
+    def startWorker(self) -> None:
+        if self.worker_thread is not None:
+            return
+
+        if self.slice_timer is not None:
+            # A sliced search can't follow the service to the worker
+            self.slice_timer.stop()
+            self.sliced_steps = None
+        self.worker_thread = QThread()
+        self.setParent(None)
+        self.moveToThread(self.worker_thread)
+        # XXX PyQt5 differ from PySide6 and native Qt
+        self.worker_thread.start()
+
+    def shutdown(self) -> None:
         self.cancel()
-        self.startSearching.emit(keyword)
+        if self.worker_thread is not None:
+            # Delete on the worker thread, where the service's timers live;
+            # deferred deletes run as the thread finishes
+            self.deleteLater()
+            self.worker_thread.quit()
+            self.worker_thread.wait()
+            self.worker_thread = None
+
+    def search(self, keyword: str) -> None:
+        self.startSearching.emit(keyword, self.nextGeneration())
 
     def cancel(self) -> None:
-        raise NotImplementedError("Subclasses must implement cancel()")
+        self.nextGeneration()
 
     def runInSeparateThread(self) -> bool:
         raise NotImplementedError("Subclasses must implement runInSeparateThread()")
@@ -0,0 +1,674 @@
+"""IDA's command and name palettes.
+
+Imports Qt, rapidfuzz and the search modules, so ifred_plugin.py only
+imports it when a palette is first shown or IDA is idle."""
+import json
+import sys
+import time
+from typing import Callable, Dict, Iterator, List, Optional, Tuple
+import idaapi
+import ida_bytes
+import ida_name
+import ida_kernwin
+import ida_nalt
+import ida_registry
+import ida_strlist
+import idautils
+from .qt_bindings import *
+
+from .api import Action, cleanup_palettes, palette_service, release_palette, set_path_handler, show_palette
+from .basic_service import BasicService, distances
+from .enumeration import ENUMERATE_BATCH, Enumerator, StageTimings, pipelined
+from .federated import FederatedService
+from .name_service import NameSearchService
+from .spill import SpilledAction, format_report, memory_report, resident_bytes, spill
+from .utils import asset_cache, load_json
+from .versioned import VersionedList
+from . import service_pool
+
+if idaapi.IDA_SDK_VERSION < 900:
+    import ida_struct
+    import ida_enum
+
+# Longest string literal text shown in the name palette
+MAX_STRING_LENGTH = 256
+
+def name_palette_name() -> str:
+    """Name palettes are per input file, so recents don't leak between databases"""
+    return f"name palette{ida_nalt.get_input_file_path()}"
+
+def compile_blacklist(content: str) -> List[QRegularExpression]:
+    try:
+        blacklist = json.loads(content)["blacklist"]
+        return [QRegularExpression(pattern) for pattern in blacklist if pattern]
+    except:
+        return []
+
+def get_blacklist() -> List[QRegularExpression]:
+    """Get blacklisted patterns from config, compiled once per config change"""
+    return asset_cache.derived("config.json", "blacklist", compile_blacklist)
+
+# Timings of the last enumeration of "actions", "names" and "types"
+enumeration_timings: Dict[str, StageTimings] = {}
+
+def action_batches(actions: List[str], size: int = ENUMERATE_BATCH) -> Iterator[List[Tuple[str, str, str]]]:
+    """(id, label, shortcut) of the enabled, not blacklisted actions"""
+    blacklist = get_blacklist()
+    get_state = idaapi.get_action_state
+    get_label = idaapi.get_action_label
+    get_shortcut = idaapi.get_action_shortcut
+
+    for start in range(0, len(actions), size):
+        batch = []
+        for item in actions[start:start + size]:
+            # Check blacklist
+            if any(pattern.match(item).hasMatch() for pattern in blacklist):
+                continue
+
+            # Get action state
+            ok, state = get_state(item)
+            if not ok or state > idaapi.AST_ENABLE:
+                continue
+
+            batch.append((item, get_label(item), get_shortcut(item)))
+        yield batch
+
+def action_items(batch: List[Tuple[str, str, str]]) -> List[Action]:
+    return [Action(item, str(label).replace("~", ""), shortcut or "")
+            for item, label, shortcut in batch if label]
+
+def add_actions(result: List[Action], actions: List[str], timings: Optional[StageTimings] = None):
+    """Add IDA actions to result list"""
+    result += pipelined(action_batches(actions), action_items, timings or StageTimings())
+
+def name_batches(names_count: int, size: int = ENUMERATE_BATCH) -> Iterator[List[Tuple[int, Optional[str]]]]:
+    """(ea, demangled name) of the nlist entries"""
+    get_ea = idaapi.get_nlist_ea
+    get_demangled = ida_name.get_demangled_name
+    short = ida_name.GN_SHORT
+
+    for start in range(0, names_count, size):
+        eas = [get_ea(i) for i in range(start, min(start + size, names_count))]
+        yield [(ea, get_demangled(ea, 0, 0, short)) for ea in eas]
+
+def name_items(batch: List[Tuple[int, Optional[str]]]) -> List[Action]:
+    # Thunks, imports and template instances share names
+    return [Action(hex(ea), sys.intern(name)) for ea, name in batch if name]
+
+def add_names(result: List[Action], names_count: int, timings: Optional[StageTimings] = None):
+    """Add names from IDA to result list"""
+    result += pipelined(name_batches(names_count), name_items, timings or StageTimings())
+
+def get_actions() -> List[Action]:
+    """Get all available IDA actions"""
+    result = []
+    timings = enumeration_timings["actions"] = StageTimings()
+    actions = idaapi.get_registered_actions()
+
+    # Add actions except blacklisted
+    add_actions(result, actions, timings)
+
+    # Sort by name
+    started = time.perf_counter()
+    result.sort(key=lambda x: x.name.lower())
+    timings.add("sort", started)
+
+    return result
+
+def get_nice_struc_name(tid: int) -> str:
+    """Get readable structure name"""
+    """
+    tid is actually ordinal in IDA 9.0 above
+    """
+    if idaapi.IDA_SDK_VERSION < 900:
+        name = ida_struct.get_struc_name(tid)
+        if name:
+            tif = idaapi.tinfo_t()
+            if tif.get_named_type(idaapi.get_idati(), name):
+                return str(tif)
+        return name or ""
+    else:
+        ordinal = tid
+        tif = idaapi.tinfo_t()
+        tif.get_numbered_type(idaapi.get_idati(), ordinal)
+        return tif.dstr()
+
+
+def add_structs(result: List[Action]):
+    """Add structures to result list"""
+    idx = ida_struct.get_first_struc_idx()
+    while idx != idaapi.BADADDR:
+        sid = ida_struct.get_struc_by_idx(idx)
+        if sid != idaapi.BADADDR:
+            name = get_nice_struc_name(sid)
+            result.append(Action(f"struct:{sid}", name))
+        idx = ida_struct.get_next_struc_idx(idx)
+
+def add_enums(result: List[Action]):
+    """Add enums to result list"""
+    for i in range(ida_enum.get_enum_qty()):
+        enum_id = ida_enum.getn_enum(i)
+        if enum_id != idaapi.BADADDR:
+            name = get_nice_struc_name(enum_id)
+            result.append(Action(f"struct:{enum_id}", name))
+
+def type_batches(size: int = ENUMERATE_BATCH) -> Iterator[List[Tuple[int, str]]]:
+    """(ordinal, description) of the named local types"""
+    idati = idaapi.get_idati()
+    get_name = idaapi.get_numbered_type_name
+    count = idaapi.get_ordinal_count()
+
+    for start in range(1, count + 1, size):
+        yield [(ordinal, get_nice_struc_name(ordinal)) for ordinal in range(start, min(start + size, count + 1))
+               if get_name(idati, ordinal)]
+
+def type_items(batch: List[Tuple[int, str]]) -> List[Action]:
+    return [Action(f"struct:{ordinal}", description) for ordinal, description in batch]
+
+def add_types(result: List[Action], timings: Optional[StageTimings] = None):
+    if idaapi.IDA_SDK_VERSION < 900:
+        add_structs(result)
+        add_enums(result)
+    else:
+        result += pipelined(type_batches(), type_items, timings or StageTimings())
+
+
+class NamesManager:
+    class IDBHooker(idaapi.IDB_Hooks):
+        def __init__(self, mgr, _flags=0, _hkcb_flags=1):
+            super().__init__(_flags, _hkcb_flags)
+            self.mgr: "NamesManager" = mgr
+
+        def renamed(self, ea, new_name, local_name, old_name):
+            self.mgr.rename(ea, new_name)
+
+        def allsegs_moved(self, info):
+            self.mgr.rebase(info)
+
+        def struc_renamed(self, struc, success):
+            tid = struc.tid
+            self.mgr.update_struct(tid, get_nice_struc_name(tid))
+
+        def struc_created(self, tid):
+            self.mgr.update_struct(tid, get_nice_struc_name(tid))
+
+        def enum_created(self, tid):
+            self.mgr.update_struct(tid, get_nice_struc_name(tid))
+
+        def enum_renamed(self, tid):
+            self.mgr.update_struct(tid, get_nice_struc_name(tid))
+
+    class IDBHooker900(idaapi.IDB_Hooks):
+        def __init__(self, mgr, _flags=0, _hkcb_flags=1):
+            super().__init__(_flags, _hkcb_flags)
+            self.mgr = mgr
+
+        def renamed(self, ea, new_name, local_name, old_name):
+            self.mgr.rename(ea, new_name)
+
+        def allsegs_moved(self, info):
+            self.mgr.rebase(info)
+
+        def local_types_changed(self, ltc, ordinal, name):
+            if ltc in [idaapi.LTC_ADDED, idaapi.LTC_ALIASED, idaapi.LTC_EDITED]:
+                # print(f"local_types_changed. ordinal = {ordinal}, name = {name}")
+                self.mgr.update_struct(ordinal, name)
+
+    class IDPHooker(idaapi.IDP_Hooks):
+        def __init__(self, mgr, *args):
+            super().__init__(*args)
+            self.mgr: "NamesManager" = mgr
+
+        def ev_term(self):
+            # The IDB is closing: drop the names and the palette's warm search service
+            release_palette(name_palette_name())
+            self.mgr.clear()
+
+    def __init__(self):
+        self.address_to_name = {}
+        self.address_to_struct = {}
+        # Separate lists so each is searched by its own source of the name palette.
+        # Hooks replace actions rather than modify them, so searches on worker
+        # threads can keep iterating the snapshot they started with.
+        self.names: VersionedList[Action] = VersionedList()
+        self.types: VersionedList[Action] = VersionedList()
+        if idaapi.IDA_SDK_VERSION < 900:
+            self.idb_hooker = NamesManager.IDBHooker(self)
+        else:
+            self.idb_hooker = NamesManager.IDBHooker900(self)
+        self.idp_hooker = NamesManager.IDPHooker(self)
+
+        self.idb_hooker.hook()
+        self.idp_hooker.hook()
+
+    def unhook(self):
+        self.idb_hooker.unhook()
+        self.idp_hooker.unhook()
+
+    @property
+    def version(self) -> int:
+        return self.names.version + self.types.version
+
+    @property
+    def result(self) -> List[Action]:
+        """Names followed by types"""
+        return self.names.snapshot() + self.types.snapshot()
+
+    def init(self):
+        self.address_to_name.clear()
+        self.address_to_struct.clear()
+
+        for index, action in enumerate(self.names):
+            self.address_to_name[int(action.id, 16)] = index
+        for index, action in enumerate(self.types):
+            self.address_to_struct[int(action.id.split(':')[1])] = index
+
+    def rename(self, address, name):
+        if address in self.address_to_name:
+            demangled = ida_name.get_demangled_name(address, 0, 0, ida_name.GN_SHORT)
+            self.names[self.address_to_name[address]] = Action(hex(address), demangled)
+        elif self.names or self.types:  # Only if initialized
+            demangled = ida_name.get_demangled_name(address, 0, 0, ida_name.GN_SHORT)
+            self.address_to_name[address] = self.names.append(Action(hex(address), demangled))
+
+    def rebase(self, infos):
+        """Move the names of the segments moved, as one new version of the list"""
+        moves = [(seg._from, seg._from + seg.size, seg.to - seg._from) for seg in infos]
+        names = list(self.names.snapshot())
+        address_to_name = {}
+        for ea, index in self.address_to_name.items():
+            for start, end, delta in moves:
+                if start <= ea < end:
+                    ea += delta
+                    action = names[index]
+                    if isinstance(action, SpilledAction):
+                        names[index] = action.moved(ea)
+                    else:
+                        names[index] = Action(hex(ea), action.name)
+                    break
+            address_to_name[ea] = index
+        self.address_to_name = address_to_name
+        self.names.reset(names)
+
+    def update_struct(self, id, name):
+        if not self.names and not self.types:  # Not initialized yet
+            return
+
+        if id in self.address_to_struct:
+            self.types[self.address_to_struct[id]] = Action(f"struct:{id}", name)
+        else:
+            self.address_to_struct[id] = self.types.append(Action(f"struct:{id}", name))
+
+    def clear(self):
+        self.names.clear()
+        self.types.clear()
+        self.address_to_name.clear()
+        self.address_to_struct.clear()
+
+    def load(self, clear=False):
+        names_count = idaapi.get_nlist_size()
+        # structs_count = ida_struct.get_struc_qty()
+
+        if (self.names or self.types) and not clear:
+            return
+
+        names = []
+        types = []
+        enumeration_timings["names"] = name_timings = StageTimings()
+        enumeration_timings["types"] = type_timings = StageTimings()
+
+        # Add names
+        add_names(names, names_count, name_timings)
+
+        # Add types
+        add_types(types, type_timings)
+
+        if load_json("config.json").get("metrics", {}).get("log", False):
+            print(f"[ifred] names: {name_timings.summary()}, types: {type_timings.summary()}")
+
+        # Past the budget, move the names and type descriptions shown out of
+        # the heap; searches keep reading resident casefolded keys
+        budget_mb = load_json("config.json").get("search", {}).get("memory_budget_mb", 0)
+        if budget_mb and resident_bytes(names) + resident_bytes(types) > budget_mb * 2**20:
+            names = spill(names)
+            types = spill(types)
+            print(f"[ifred] {format_report(self.memory_report(names, types))}")
+
+        self.names.reset(names)
+        self.types.reset(types)
+        self.init()
+
+    def memory_report(self, names=None, types=None) -> Dict[str, Dict[str, int]]:
+        """Resident and memory-mapped bytes of the names and types, and of the
+        search indexes and distances cached for them"""
+        report = memory_report({
+            "names": self.names.snapshot() if names is None else names,
+            "types": self.types.snapshot() if types is None else types,
+        })
+        service = service_pool.get(name_palette_name())
+        if service is not None:
+            for source in service.sourceNames():
+                index = getattr(service.source(source), "index", None)
+                if index is not None:
+                    report[f"{source} index"] = index.memory_report()
+        report["distance cache"] = distances.memory_report()
+        return report
+
+    def get(self, clear=False):
+        self.load(clear)
+        return self.result
+
+
+
+class AddressIndex:
+    """Actions keyed by EA for lists too large to load up front (functions,
+    strings): enumerated a slice at a time from the event loop, then kept
+    current from IDB hooks like NamesManager does for names."""
+
+    class IDPHooker(idaapi.IDP_Hooks):
+        def __init__(self, mgr, *args):
+            super().__init__(*args)
+            self.mgr: "AddressIndex" = mgr
+
+        def ev_term(self):
+            self.mgr.clear()
+
+    def __init__(self):
+        self.items: VersionedList[Action] = VersionedList()
+        self.address_to_item: Dict[int, int] = {}
+        self.loaded = False
+        self.enumerator: Optional[Enumerator] = None
+        self.idb_hooker = self.IDBHooker(self)
+        self.idp_hooker = AddressIndex.IDPHooker(self)
+
+        self.idb_hooker.hook()
+        self.idp_hooker.hook()
+
+    def unhook(self):
+        self.clear()
+        self.idb_hooker.unhook()
+        self.idp_hooker.unhook()
+
+    def enumerate(self) -> Iterator[Tuple[int, str]]:
+        raise NotImplementedError
+
+    def describe(self, ea: int) -> Optional[str]:
+        """Current text of the item at `ea`, None if there is none"""
+        raise NotImplementedError
+
+    def load(self):
+        if self.loaded:
+            return
+
+        self.loaded = True
+        self.enumerator = Enumerator(self.enumerate(), self.extend)
+        self.enumerator.start()
+
+    @property
+    def version(self) -> int:
+        return self.items.version
+
+    def extend(self, chunk: List[Tuple[int, str]]):
+        added = []
+        eas = []
+        for ea, name in chunk:
+            if ea in self.address_to_item:
+                self.put(ea, name)
+            else:
+                eas.append(ea)
+                added.append(Action(hex(ea), sys.intern(name)))
+        start = self.items.extend(added)
+        self.address_to_item.update(zip(eas, range(start, start + len(eas))))
+
+    def put(self, ea: int, name: str):
+        index = self.address_to_item.get(ea)
+        if index is None:
+            self.address_to_item[ea] = self.items.append(Action(hex(ea), sys.intern(name)))
+        else:
+            self.items[index] = Action(hex(ea), sys.intern(name))
+
+    def refresh(self, ea: int):
+        if not self.loaded:
+            return
+
+        name = self.describe(ea)
+        if name:
+            self.put(ea, name)
+        else:
+            self.remove(ea)
+
+    def remove(self, ea: int):
+        index = self.address_to_item.pop(ea, None)
+        if index is None:
+            return
+
+        # Move the last item into the hole, the order doesn't matter for search
+        last = self.items.pop()
+        if index < len(self.items):
+            self.items[index] = last
+            self.address_to_item[int(last.id, 16)] = index
+
+    def remove_range(self, start: int, end: int):
+        if end - start < len(self.address_to_item):
+            doomed = [ea for ea in range(start, end) if ea in self.address_to_item]
+        else:
+            doomed = [ea for ea in self.address_to_item if start <= ea < end]
+        for ea in doomed:
+            self.remove(ea)
+
+    def rebase(self, infos):
+        moves = []
+        for seg in infos:
+            for key in list(self.address_to_item.keys()):
+                if seg._from <= key and key < seg._from + seg.size:
+                    moves.append((key, key + seg.to - seg._from))
+
+        indexes = [(self.address_to_item.pop(old_ea), new_ea) for old_ea, new_ea in moves]
+        changes = {}
+        for index, new_ea in indexes:
+            changes[index] = Action(hex(new_ea), self.items[index].name)
+            self.address_to_item[new_ea] = index
+        self.items.update(changes)
+
+    def clear(self):
+        if self.enumerator is not None:
+            self.enumerator.stop()
+            self.enumerator = None
+        self.loaded = False
+        self.items.clear()
+        self.address_to_item.clear()
+
+def function_signature(ea: int) -> str:
+    """One-line prototype including the name, or just the name if untyped"""
+    signature = idaapi.print_type(ea, idaapi.PRTYPE_1LINE)
+    return signature or ida_name.get_demangled_name(ea, 0, 0, ida_name.GN_SHORT) or ida_name.get_ea_name(ea)
+
+class FunctionsManager(AddressIndex):
+    class IDBHooker(idaapi.IDB_Hooks):
+        def __init__(self, mgr, _flags=0, _hkcb_flags=1):
+            super().__init__(_flags, _hkcb_flags)
+            self.mgr: "FunctionsManager" = mgr
+
+        def func_added(self, pfn):
+            self.mgr.refresh(pfn.start_ea)
+
+        def func_updated(self, pfn):
+            self.mgr.refresh(pfn.start_ea)
+
+        def deleting_func(self, pfn):
+            self.mgr.remove(pfn.start_ea)
+
+        def renamed(self, ea, new_name, local_name, old_name):
+            if ea in self.mgr.address_to_item:
+                self.mgr.refresh(ea)
+
+        def ti_changed(self, ea, type, fnames):
+            if ea in self.mgr.address_to_item:
+                self.mgr.refresh(ea)
+
+        def allsegs_moved(self, info):
+            self.mgr.rebase(info)
+
+    def enumerate(self):
+        for ea in idautils.Functions():
+            yield ea, function_signature(ea)
+
+    def describe(self, ea):
+        pfn = idaapi.get_func(ea)
+        if pfn is None or pfn.start_ea != ea:
+            return None
+        return function_signature(ea)
+
+def string_text(contents) -> str:
+    if isinstance(contents, bytes):
+        contents = contents.decode("utf-8", "replace")
+    text = contents[:MAX_STRING_LENGTH]
+    return text.replace("\r", "\\r").replace("\n", "\\n")
+
+class StringsManager(AddressIndex):
+    class IDBHooker(idaapi.IDB_Hooks):
+        def __init__(self, mgr, _flags=0, _hkcb_flags=1):
+            super().__init__(_flags, _hkcb_flags)
+            self.mgr: "StringsManager" = mgr
+
+        def make_data(self, ea, flags, tid, len):
+            if ida_bytes.is_strlit(flags):
+                self.mgr.refresh(ea)
+
+        def destroyed_items(self, ea1, ea2, will_disable_range):
+            self.mgr.remove_range(ea1, ea2)
+
+        def allsegs_moved(self, info):
+            self.mgr.rebase(info)
+
+    def enumerate(self):
+        # idautils.Strings() would rebuild the list, a scan of the whole
+        # database; the list kept in the database is read as is
+        if not ida_strlist.get_strlist_qty():
+            # Never built for this database, so build it in a slice of its own
+            yield None
+            ida_kernwin.show_wait_box("Building the string list...")
+            try:
+                ida_strlist.build_strlist()
+            finally:
+                ida_kernwin.hide_wait_box()
+            yield None
+
+        item = ida_strlist.string_info_t()
+        for index in range(ida_strlist.get_strlist_qty()):
+            if ida_strlist.get_strlist_item(item, index):
+                contents = ida_bytes.get_strlit_contents(item.ea, item.length, item.type)
+                yield item.ea, string_text(contents or b"")
+
+    def describe(self, ea):
+        if not ida_bytes.is_strlit(ida_bytes.get_flags(ea)):
+            return None
+        contents = ida_bytes.get_strlit_contents(ea, -1, ida_nalt.get_str_type(ea))
+        return string_text(contents) if contents else None
+
+_address_indexes: Dict[str, AddressIndex] = {}
+
+def get_address_index(kind: str) -> AddressIndex:
+    """The functions or strings index, created and hooked on first use"""
+    mgr = _address_indexes.get(kind)
+    if mgr is None:
+        mgr = _address_indexes[kind] = (FunctionsManager if kind == "functions" else StringsManager)()
+    return mgr
+
+def get_names_manager() -> NamesManager:
+    global _names_manager
+    if not '_names_manager' in globals():
+        _names_manager = NamesManager()
+    return _names_manager
+
+def get_names(clear=False):
+    return get_names_manager().get(clear)
+
+def action_shortcut(ctx) -> str:
+    shortcut = idaapi.get_action_shortcut(ctx.action)
+    return shortcut.replace("-", "+") if shortcut else shortcut
+
+def show_command_palette(ctx) -> int:
+    show_palette("command palette", "Enter action or option name...",
+                get_actions(), action_shortcut(ctx), lambda action: ida_kernwin.process_ui_action(action.id))
+    return 1
+
+NAME_SOURCES = ("names", "types", "functions", "strings")
+
+def name_source(source: str) -> VersionedList:
+    """Actions of a name palette source, loading them if needed"""
+    if source in ("names", "types"):
+        mgr = get_names_manager()
+        mgr.load()
+        return getattr(mgr, source)
+
+    mgr = get_address_index(source)
+    # Functions and strings arrive in the background while the palette is open
+    mgr.load()
+    return mgr.items
+
+def name_palette_service(name: str) -> FederatedService:
+    """The configured sources searched side by side, each on its own worker"""
+    config = load_json("config.json").get("search", {})
+    quota = config.get("source_quota", 20000)
+    sources = []
+    for source in config.get("name_sources", ["names", "types"]):
+        if source not in NAME_SOURCES:
+            continue
+        actions = name_source(source)
+        if source == "names":
+            service = NameSearchService(None, name, actions)
+        else:
+            service = BasicService(None, f"{name}:{source}", actions)
+        sources.append((source, service, quota))
+    return FederatedService(None, sources, config.get("parallel_sources", 0))
+
+def show_name_palette(ctx) -> int:
+    def callback(action):
+        if action.id.startswith("struct:"):
+            tid = int(action.id[7:])
+            if idaapi.IDA_SDK_VERSION < 900:
+                if ida_enum.get_enum_idx(tid) == idaapi.BADADDR:
+                    ida_kernwin.open_structs_window(tid)
+                else:
+                    ida_kernwin.open_enums_window(tid)
+            else:
+                ordinal = tid
+                tif = idaapi.tinfo_t()
+                tif.get_numbered_type(None, ordinal)
+                if hasattr(ida_kernwin, "open_til_view_window"):
+                    if tif is not None:
+                        ida_kernwin.open_til_view_window(tif)
+                    else:
+                        print(f"[palatte] Something error happend, no corespoding structs/enums with ordinal {ordinal}")
+                else:
+                    ida_kernwin.open_loctypes_window(ordinal)
+
+        else:
+            address = int(action.id, 16)
+            ida_kernwin.jumpto(address)
+            name = ida_name.get_ea_name(address)
+            if name:
+                ida_registry.reg_update_strlist("History\\$", name, 32)
+        return True
+
+    name = name_palette_name()
+    service = palette_service(name, lambda: name_palette_service(name))
+    for source in service.sourceNames():
+        service.source(source).setActions(name_source(source))
+
+    show_palette(name,
+                "Enter symbol name...",
+                service, action_shortcut(ctx), callback)
+    return 1
+
+def setup(path_handler: Callable[[str], str]) -> None:
+    set_path_handler(path_handler)
+
+def term() -> None:
+    cleanup_palettes()
+    if '_names_manager' in globals():
+        _names_manager.unhook()
+    for mgr in _address_indexes.values():
+        mgr.unhook()
+    _address_indexes.clear()
@@ -0,0 +1,38 @@
+import time
+from typing import List
+
+from .qt_bindings import *
+from .action import Action
+from .basic_service import BasicService
+from .filter import SearchMetrics
+from .search_index import parse_address
+
+PRECEDING_NAMES = 3
+
+class NameSearchService(BasicService):
+    """Search service of the name palette.
+
+    Address-like queries (0x401a3c, 401a3c) are answered from the sorted EA
+    index and shown ahead of the fuzzy results: the name at that address, or
+    `name+offset` of the enclosing name, then the nearest preceding names."""
+
+    def answersInstantly(self, keyword: str) -> bool:
+        return parse_address(keyword) is not None or super().answersInstantly(keyword)
+
+    def pinnedResults(self, keyword: str, actions: List[Action], metrics: SearchMetrics) -> List[Action]:
+        ea = parse_address(keyword)
+        if ea is None:
+            return []
+
+        started = time.perf_counter()
+        exact, before = self.searchIndex(actions).lookup_address(ea, PRECEDING_NAMES)
+        result = [actions[row] for row in exact]
+
+        if not exact and before:
+            enclosing = actions[before[0]]
+            offset = ea - int(enclosing.id, 16)
+            result.append(Action(hex(ea), f"{enclosing.name}+0x{offset:X}", description=f"{ea:#x}"))
+
+        result += [actions[row] for row in before]
+        metrics.add("address", started)
+        return result
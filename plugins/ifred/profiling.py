@@ -0,0 +1,41 @@
+import io
+import cProfile
+import pstats
+import tracemalloc
+from typing import Callable
+
+PROFILE_KINDS = ("cprofile", "tracemalloc")
+
+def capture(kind: str, func: Callable[[], None], limit: int = 25) -> str:
+    """Run `func` under cProfile or tracemalloc and return a text report"""
+    if kind == "cprofile":
+        profile = cProfile.Profile()
+        profile.enable()
+        try:
+            func()
+        finally:
+            profile.disable()
+
+        stream = io.StringIO()
+        pstats.Stats(profile, stream=stream).sort_stats("cumulative").print_stats(limit)
+        return stream.getvalue()
+
+    if kind == "tracemalloc":
+        started = not tracemalloc.is_tracing()
+        if started:
+            tracemalloc.start()
+        tracemalloc.reset_peak()
+        try:
+            func()
+            current, peak = tracemalloc.get_traced_memory()
+            top = tracemalloc.take_snapshot().statistics("lineno")[:limit]
+        finally:
+            if started:
+                tracemalloc.stop()
+
+        lines = [f"current {current // 1024} KiB, peak {peak // 1024} KiB"]
+        lines += [str(stat) for stat in top]
+        return "\n".join(lines)
+
+    func()
+    return ""
@@ -2,14 +2,14 @@
 try:
     from PyQt5 import QtCore, QtGui, QtWidgets, uic
     from PyQt5.QtWidgets import (
-        QApplication, QMainWindow, QWidget, QFrame, QLineEdit,
+        QApplication, QMainWindow, QWidget, QFrame, QLineEdit, QLabel,
         QVBoxLayout, QShortcut, QStyle, QStyledItemDelegate,
         QStyleOptionViewItem, QListView, QAbstractItemView,
         QGraphicsDropShadowEffect)
     from PyQt5.QtCore import (
         Qt, QRegularExpression, QThread, QObject,
         QAbstractEventDispatcher, QTimer, QFileSystemWatcher,
-        QDir, QFile, QIODevice, QEvent, QSize, QRectF,
+        QDir, QFile, QIODevice, QEvent, QEventLoop, QSize, QRectF,
         QAbstractItemModel, QModelIndex, QSettings)
     from PyQt5.QtGui import (
         QFocusEvent, QKeyEvent, QKeySequence, QColor,
@@ -24,14 +24,14 @@ except ImportError:
     try:
         from PySide6 import QtCore, QtGui, QtWidgets, QtUiTools
         from PySide6.QtWidgets import (
-            QApplication, QMainWindow, QWidget, QFrame, QLineEdit,
+            QApplication, QMainWindow, QWidget, QFrame, QLineEdit, QLabel,
             QVBoxLayout, QStyle, QStyledItemDelegate,
             QStyleOptionViewItem, QListView, QAbstractItemView,
             QGraphicsDropShadowEffect)
         from PySide6.QtCore import (
             Qt, QRegularExpression, QThread, QObject, Signal,
             QAbstractEventDispatcher, QTimer, QFileSystemWatcher,
-            QDir, QFile, QIODevice, QEvent, QSize, QRectF,
+            QDir, QFile, QIODevice, QEvent, QEventLoop, QSize, QRectF,
             QAbstractItemModel, QModelIndex, QSettings)
         from PySide6.QtGui import (
             QFocusEvent, QKeyEvent, QKeySequence, QColor, QShortcut,
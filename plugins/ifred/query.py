@@ -0,0 +1,57 @@
+import re
+from dataclasses import dataclass
+from functools import lru_cache
+from typing import Optional, Pattern
+
+# Scope prefixes: types are the ids starting with "struct:", names the rest
+SCOPES = {"t:": "types", "f:": "names"}
+
+@dataclass
+class Query:
+    """A palette keyword parsed into an operator, its text and a scope.
+
+    ^prefix  names starting with prefix
+    "exact"  names equal to exact (case-insensitive)
+    /regex/  names matching the regular expression
+    t: f:    restrict any of the above, or a fuzzy query, to types or names"""
+    kind: str = "fuzzy"
+    text: str = ""
+    scope: str = ""
+    pattern: Optional[Pattern] = None
+    error: str = ""
+
+    @property
+    def scored(self) -> bool:
+        """Whether results are ranked by `Action.score`; otherwise they keep index order"""
+        return self.kind == "fuzzy" and len(self.text) > 1
+
+    @property
+    def highlight(self) -> str:
+        """Text to highlight in the results"""
+        return "" if self.kind == "regex" else self.text
+
+@lru_cache(maxsize=64)
+def compile_regex(text: str) -> Pattern:
+    return re.compile(text, re.IGNORECASE)
+
+def parse_query(keyword: str) -> Query:
+    query = Query(text=keyword)
+
+    scope = SCOPES.get(keyword[:2].lower())
+    if scope:
+        query.scope = scope
+        keyword = keyword[2:].lstrip()
+        query.text = keyword
+
+    if len(keyword) > 1 and keyword.startswith("^"):
+        query.kind, query.text = "prefix", keyword[1:]
+    elif len(keyword) > 1 and keyword.startswith('"'):
+        query.kind, query.text = "exact", keyword[1:-1] if keyword.endswith('"') else keyword[1:]
+    elif len(keyword) > 1 and keyword.startswith("/"):
+        query.kind, query.text = "regex", keyword[1:-1] if keyword.endswith("/") and len(keyword) > 2 else keyword[1:]
+        try:
+            query.pattern = compile_regex(query.text)
+        except re.error as e:
+            query.error = str(e)
+
+    return query
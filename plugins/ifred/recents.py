@@ -0,0 +1,183 @@
+import bisect
+import math
+import threading
+import time
+from collections import Counter
+from typing import Dict, List
+from .qt_bindings import *
+
+# Selected actions shown above the separator per search; more are ranked as usual
+MAX_RECENT_ITEMS = 100
+# Actions whose frecency is kept, the lowest ranked one is dropped past this
+MAX_TRACKED_ITEMS = 5000
+MAX_RECENT_QUERIES = 100
+# Selections are written to QSettings at most once per this many milliseconds
+FLUSH_DELAY_MS = 2000
+# A selection counts half as much after this many days
+FRECENCY_HALF_LIFE_DAYS = 14.0
+# Frecencies are measured in half lives since this time (2020-01-01)
+FRECENCY_EPOCH = 1577836800
+
+class RecentActions(QObject):
+    """Frecency of the actions selected in a palette.
+
+    Each selection adds a weight of 2^(t / half life) to the action's
+    frecency, so older selections count for less the longer ago they were.
+    All weights age alike, which keeps the order of the actions unchanged as
+    time passes: the rank table (ids by descending frecency) only moves the
+    selected action, with a bisect and one list insertion. Frecencies are
+    kept as log2 of the sums to stay in float range.
+
+    They are stored as "frecency<TAB>id" lines, best first, and written to
+    disk by a coalescing timer (or `flush()` on close) rather than on every
+    selection. The searching thread selects while the GUI thread may flush,
+    so the state is guarded by `lock`."""
+
+    def __init__(self, palette_name: str, parent: QObject = None):
+        super().__init__(parent)
+        self.storage = QSettings("ifred", palette_name)
+        self.lock = threading.Lock()
+        self.scores: Dict[str, float] = {}
+        # Rank table: ids best first, and their negated frecencies (ascending)
+        self.ranked: List[str] = []
+        self.keys: List[float] = []
+        # Bumped on every change
+        self.counter = 0
+        self.dirty = False
+
+        self.flush_timer = QTimer(self)
+        self.flush_timer.setSingleShot(True)
+        self.flush_timer.setInterval(FLUSH_DELAY_MS)
+        self.flush_timer.timeout.connect(self.flush)
+
+        self.load()
+
+    @staticmethod
+    def now() -> float:
+        return (time.time() - FRECENCY_EPOCH) / (FRECENCY_HALF_LIFE_DAYS * 86400)
+
+    def load(self) -> None:
+        stored = self.storage.value("frecency", None)
+        if stored:
+            self.scores = {}
+            for line in str(stored).split("\n"):
+                score, _, id = line.partition("\t")
+                if id:
+                    self.scores[id] = float(score)
+        else:
+            # Migrate recency-only lists, oldest first, as one selection each
+            stored = self.storage.value("recent", None)
+            if stored is not None:
+                ids = [id for id in str(stored).split("\n") if id]
+            else:
+                # The old {id: age} format, age 0 is the most recent
+                legacy = self.storage.value("recent_actions", {}) or {}
+                ids = sorted(legacy, key=lambda id: int(legacy[id]), reverse=True)
+            now = self.now()
+            self.scores = {id: now - (len(ids) - i) * 1e-6 for i, id in enumerate(ids)}
+
+        self.ranked = sorted(self.scores, key=self.scores.get, reverse=True)[:MAX_TRACKED_ITEMS]
+        self.scores = {id: self.scores[id] for id in self.ranked}
+        self.keys = [-self.scores[id] for id in self.ranked]
+        self.counter += 1
+
+    def touch(self, id: str) -> None:
+        score = self.now()
+        with self.lock:
+            old = self.scores.get(id)
+            if old is not None:
+                self.unrank(id, old)
+                high, low = max(old, score), min(old, score)
+                score = high + math.log2(1 + 2 ** (low - high))
+
+            self.scores[id] = score
+            position = bisect.bisect_left(self.keys, -score)
+            self.keys.insert(position, -score)
+            self.ranked.insert(position, id)
+
+            if len(self.ranked) > MAX_TRACKED_ITEMS:
+                self.keys.pop()
+                del self.scores[self.ranked.pop()]
+
+            self.counter += 1
+            self.dirty = True
+        self.flush_timer.start()
+
+    def unrank(self, id: str, score: float) -> None:
+        position = bisect.bisect_left(self.keys, -score)
+        while self.ranked[position] != id:
+            position += 1
+        del self.keys[position]
+        del self.ranked[position]
+
+    def snapshot(self) -> Dict[str, float]:
+        with self.lock:
+            return dict(self.scores)
+
+    def flush(self) -> None:
+        """Write the frecencies if they changed; safe from any thread"""
+        with self.lock:
+            if not self.dirty:
+                return
+            self.dirty = False
+            self.storage.setValue("frecency", "\n".join(f"{-key:.6f}\t{id}" for key, id in zip(self.keys, self.ranked)))
+            self.storage.remove("recent")
+            self.storage.remove("recent_actions")
+            self.storage.sync()
+
+class RecentQueries(QObject):
+    """Queries that led to a selection in a palette, oldest first. The most
+    frequent ones are searched ahead of time while the palette is idle.
+
+    Shared by the palette's windows, see `for_palette`, and written to disk
+    by a coalescing timer (or `flush()` on close) like RecentActions."""
+
+    def __init__(self, palette_name: str, parent: QObject = None):
+        super().__init__(parent)
+        self.storage = QSettings("ifred", palette_name)
+        stored = self.storage.value("queries", None)
+        self.queries: List[str] = [query for query in str(stored).split("\n") if query] if stored else []
+        self.dirty = False
+
+        self.flush_timer = QTimer(self)
+        self.flush_timer.setSingleShot(True)
+        self.flush_timer.setInterval(FLUSH_DELAY_MS)
+        self.flush_timer.timeout.connect(self.flush)
+
+    @classmethod
+    def for_palette(cls, palette_name: str) -> "RecentQueries":
+        """The instance of `palette_name`, so a window opened before the last
+        one flushed still sees its queries"""
+        queries = recent_queries.get(palette_name)
+        if queries is None:
+            queries = recent_queries[palette_name] = cls(palette_name)
+        return queries
+
+    def record(self, keyword: str) -> None:
+        if not keyword or "\n" in keyword:
+            return
+        self.queries.append(keyword)
+        del self.queries[:-MAX_RECENT_QUERIES]
+        self.dirty = True
+        self.flush_timer.start()
+
+    def flush(self) -> None:
+        """Write the queries if they changed"""
+        self.flush_timer.stop()
+        if not self.dirty:
+            return
+        self.dirty = False
+        self.storage.setValue("queries", "\n".join(self.queries))
+
+    def frequent(self, count: int) -> List[str]:
+        counts = Counter(self.queries)
+        last = {query: i for i, query in enumerate(self.queries)}
+        # Ties go to the most recent
+        return sorted(counts, key=lambda query: (-counts[query], -last[query]))[:count]
+
+# RecentQueries of each palette, created on the GUI thread
+recent_queries: Dict[str, RecentQueries] = {}
+
+def flush_queries() -> None:
+    for queries in recent_queries.values():
+        queries.flush()
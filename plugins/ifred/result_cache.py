@@ -0,0 +1,199 @@
+import itertools
+import operator
+import threading
+from dataclasses import dataclass
+from typing import Callable, Dict, List, Optional, Tuple
+
+from .action import Action
+
+# Corpus changes queued for the empty view; past this it is rebuilt instead
+VIEW_DELTA_LIMIT = 4096
+
+class EmptyView:
+    """Results of the empty query: up to `limit` recent actions, most frecent
+    first, then every other action in corpus order.
+
+    Palettes open on this list, so rather than walking the corpus on every
+    open it is built once and patched with the corpus changes reported by
+    the writer (`record`, any thread) and the actions selected (`touch`).
+    The searching thread applies them when the view is next asked for.
+    Changes that can't be patched (pops, recent items appearing, bulk
+    replacements) make it rebuild."""
+
+    def __init__(self, limit: int):
+        self.limit = limit
+        self.lock = threading.Lock()
+        self.items: List[Action] = []
+        self.recent_count = 0
+        self.key = None
+        # Row of each action in `items`, keyed by object; built on the first patch
+        self.positions: Optional[Dict[int, int]] = None
+        # Corpus row of each recent item, keyed by object. The other items are
+        # the rest of the corpus in order, which locates any of them from these.
+        self.recent_rows: Dict[int, int] = {}
+        self.deltas: List[Tuple[Optional[Action], Optional[Action]]] = []
+        self.touched: List[Action] = []
+        self.stale = True
+
+    def invalidate(self) -> None:
+        with self.lock:
+            self.stale = True
+            self.deltas = []
+            self.touched = []
+
+    def touch(self, action: Action) -> None:
+        """Move `action`, just selected, into the recent items"""
+        with self.lock:
+            if not self.stale:
+                self.touched.append(action)
+
+    def record(self, old: Optional[Action], new: Optional[Action]) -> None:
+        with self.lock:
+            if self.stale:
+                return
+            if (old is None and new is None) or len(self.deltas) >= VIEW_DELTA_LIMIT:
+                self.stale = True
+                self.deltas = []
+                self.touched = []
+            else:
+                self.deltas.append((old, new))
+
+    def get(self, key, corpus: Callable[[], List[Action]], recents: Dict[str, float]) -> Tuple[List[Action], int]:
+        """The view and its recent count. `key` changes when the corpus or the
+        recents change other than through recorded deltas; `corpus` is only
+        called to rebuild. Don't modify the returned list."""
+        with self.lock:
+            deltas, self.deltas = self.deltas, []
+            touched, self.touched = self.touched, []
+            rebuild = self.stale or key != self.key
+            self.stale = False
+
+        if rebuild or not self.patch(deltas, recents) or not all(self.promote(action, recents) for action in touched):
+            # Deltas recorded from here on are applied next time; patching
+            # skips the ones the corpus already had
+            self.build(corpus(), recents)
+            self.key = key
+        return self.items, self.recent_count
+
+    def build(self, actions: List[Action], recents: Dict[str, float]) -> None:
+        recent_rows = {}
+        if not recents:
+            recent, others = [], list(actions)
+        else:
+            recent, others = [], []
+            for row, action in enumerate(actions):
+                if action.id in recents:
+                    recent.append(action)
+                    recent_rows[id(action)] = row
+                else:
+                    others.append(action)
+            recent.sort(key=lambda action: -recents[action.id])
+            if len(recent) > self.limit:
+                recent = recent[:self.limit]
+                shown = set(map(id, recent))
+                others = [action for action in actions if id(action) not in shown]
+                recent_rows = {key: row for key, row in recent_rows.items() if key in shown}
+
+        self.items = recent + others
+        self.recent_count = len(recent)
+        self.recent_rows = recent_rows
+        self.positions = None
+
+    def patch(self, deltas: List[Tuple[Optional[Action], Optional[Action]]], recents: Dict[str, float]) -> bool:
+        """Apply corpus deltas in place; False if the view must be rebuilt"""
+        if not deltas:
+            return True
+        if self.positions is None:
+            self.positions = {id(action): row for row, action in enumerate(self.items)}
+
+        positions = self.positions
+        for old, new in deltas:
+            if new is not None and id(new) in positions:
+                continue
+            if old is None:
+                if new.id in recents:
+                    return False
+                positions[id(new)] = len(self.items)
+                self.items.append(new)
+            elif id(old) not in positions:
+                if new is not None:
+                    return False
+            elif new is None:
+                # Rows after it would shift
+                return False
+            else:
+                row = positions.pop(id(old))
+                self.items[row] = new
+                positions[id(new)] = row
+                if id(old) in self.recent_rows:
+                    self.recent_rows[id(new)] = self.recent_rows.pop(id(old))
+        return True
+
+    def promote(self, action: Action, recents: Dict[str, float]) -> bool:
+        """Move a selected action to its place among the recent items, and
+        the one that drops out of them back among the others. False if the
+        view must be rebuilt."""
+        score = recents.get(action.id)
+        if score is None:
+            return False
+
+        items = self.items
+        if id(action) in self.recent_rows:
+            row = operator.indexOf(map(operator.is_, items[:self.recent_count], itertools.repeat(action)), True)
+            del items[row]
+            self.recent_count -= 1
+        else:
+            try:
+                row = operator.indexOf(map(operator.is_, itertools.islice(items, self.recent_count, None),
+                                           itertools.repeat(action)), True)
+            except ValueError:
+                return False
+            del items[self.recent_count + row]
+            self.recent_rows[id(action)] = self.corpusRow(row)
+
+        # Recent items are ordered by descending frecency, then corpus order;
+        # the selection only changed the frecency of this one
+        order = (-score, self.recent_rows[id(action)])
+        position = 0
+        while position < self.recent_count and (
+                -recents.get(items[position].id, 0.0), self.recent_rows[id(items[position])]) < order:
+            position += 1
+        items.insert(position, action)
+        self.recent_count += 1
+
+        if self.recent_count > self.limit:
+            self.recent_count -= 1
+            dropped = items.pop(self.recent_count)
+            corpus_row = self.recent_rows.pop(id(dropped))
+            items.insert(self.recent_count + self.otherRow(corpus_row), dropped)
+
+        self.positions = None
+        return True
+
+    def corpusRow(self, other_row: int) -> int:
+        """Corpus row of the `other_row`th item past the recent ones"""
+        row = other_row
+        for recent_row in sorted(self.recent_rows.values()):
+            if recent_row > row:
+                break
+            row += 1
+        return row
+
+    def otherRow(self, corpus_row: int) -> int:
+        """Row past the recent items where the corpus row `corpus_row` belongs"""
+        return corpus_row - sum(1 for recent_row in self.recent_rows.values() if recent_row < corpus_row)
+
+@dataclass
+class CachedResult:
+    """Results of a search kept for an instant answer while `key` holds"""
+    key: tuple
+    highlight: str
+    items: List[Action]
+    recent_count: int
+    # Scores of the ranked items, set on them when the result is shown
+    scores: Optional[List[float]] = None
+
+    def restoreScores(self) -> None:
+        if self.scores is not None:
+            for action, score in zip(self.items[self.recent_count:], self.scores):
+                action.score = score
@@ -0,0 +1,199 @@
+import bisect
+import re
+import sys
+from array import array
+from collections import Counter
+from typing import Dict, List, Optional, Sequence, Set, Tuple
+
+from .action import Action
+from .spill import SpilledAction
+
+# 0x401a3c, 401A3C or 401a3ch
+ADDRESS_RE = re.compile(r"^(0x)?([0-9a-f]+)h?$", re.IGNORECASE)
+
+# Segment starts: after a non-alphanumeric (::, _, <, ~, ...), camelCase humps
+# and digits following letters
+BOUNDARY_RE = re.compile(r"(?<![A-Za-z0-9])[A-Za-z0-9]|(?<=[a-z])[A-Z]|(?<=[A-Za-z])[0-9]")
+
+def boundaries(name: str) -> Tuple[int, ...]:
+    return tuple(match.start() for match in BOUNDARY_RE.finditer(name))
+
+def segment_match(query: str, name: str, offsets: Tuple[int, ...]) -> bool:
+    """Whether lowercase `query` is a run of segment prefixes of lowercase `name`,
+    e.g. "bsa" or "bstrapp" for basic_string::append"""
+    failed = set()
+
+    def match(qi: int, bi: int) -> bool:
+        if qi == len(query):
+            return True
+        if (qi, bi) in failed:
+            return False
+        for b in range(bi, len(offsets)):
+            start = offsets[b]
+            if name[start] != query[qi]:
+                continue
+            # Longest run of the query at this segment, then shorter ones
+            length = 1
+            while (qi + length < len(query) and start + length < len(name)
+                   and name[start + length] == query[qi + length]):
+                length += 1
+            next_b = b + 1
+            for k in range(length, 0, -1):
+                while next_b < len(offsets) and offsets[next_b] < start + k:
+                    next_b += 1
+                if match(qi + k, next_b):
+                    return True
+                next_b = b + 1
+        failed.add((qi, bi))
+        return False
+
+    return match(0, 0)
+
+def parse_address(keyword: str) -> Optional[int]:
+    """EA typed as `keyword`, if it looks like an address rather than a name"""
+    match = ADDRESS_RE.match(keyword.strip())
+    if not match:
+        return None
+
+    digits = match.group(2)
+    # Without 0x, "add" or "beef" are more likely names than addresses
+    if not match.group(1) and (len(digits) < 4 or not any(c.isdigit() for c in digits)):
+        return None
+    return int(digits, 16)
+
+class SearchIndex:
+    """Lookup structures over a palette's actions, each built on first use.
+
+    An index is tied to one actions list and corpus version; services replace
+    it when either changes."""
+
+    def __init__(self, actions: List[Action], version: int = 0):
+        self.actions = actions
+        self.version = version
+        self.size = len(actions)
+        # Sorted EAs of the named rows and the row of each
+        self.eas: Optional[array] = None
+        self.ea_rows: Optional[array] = None
+        self.folded: Optional[List[str]] = None
+        # Rows sorted by casefolded name, and those names, for prefix queries
+        self.sorted_rows: Optional[array] = None
+        self.sorted_names: Optional[List[str]] = None
+        # Casefolded name -> rows, for exact queries
+        self.exact: Optional[Dict[str, List[int]]] = None
+        # Rows of each scope ("types", "names")
+        self.partitions: Optional[Dict[str, array]] = None
+        # Names shared by several rows: thunks, imports, template instances
+        self.duplicates: Optional[Set[str]] = None
+        # (segment start offsets, segment initials) of each row, computed the
+        # first time the row is scored
+        self.bounds: List[Optional[Tuple[Tuple[int, ...], str]]] = [None] * self.size
+
+    def matches(self, actions: List[Action], version: int) -> bool:
+        return actions is self.actions and version == self.version and len(actions) == self.size
+
+    def build_eas(self) -> None:
+        pairs = sorted((int(action.id, 16), row) for row, action in enumerate(self.actions)
+                       if action.id.startswith("0x"))
+        self.eas = array("Q", (ea for ea, _ in pairs))
+        self.ea_rows = array("q", (row for _, row in pairs))
+
+    def lookup_address(self, ea: int, preceding: int = 3) -> Tuple[List[int], List[int]]:
+        """Rows named exactly at `ea`, and the nearest named rows before it"""
+        if self.eas is None:
+            self.build_eas()
+
+        end = bisect.bisect_right(self.eas, ea)
+        start = bisect.bisect_left(self.eas, ea, 0, end)
+        exact = list(self.ea_rows[start:end])
+        before = [self.ea_rows[i] for i in range(start - 1, max(-1, start - 1 - preceding), -1)]
+        return exact, before
+
+    def folded_names(self) -> List[str]:
+        # Spilled actions hand out their resident keys rather than copies
+        if self.folded is None:
+            self.folded = [action.folded for action in self.actions]
+        return self.folded
+
+    def duplicate_names(self) -> Set[str]:
+        """Search keys shared by several rows"""
+        if self.duplicates is None:
+            counts = Counter(action.key for action in self.actions)
+            self.duplicates = {name for name, count in counts.items() if count > 1}
+        return self.duplicates
+
+    def build_prefix(self) -> None:
+        folded = self.folded_names()
+        self.sorted_rows = array("q", sorted(range(len(folded)), key=folded.__getitem__))
+        self.sorted_names = [folded[row] for row in self.sorted_rows]
+
+    def prefix_rows(self, prefix: str) -> Sequence[int]:
+        """Rows whose name starts with `prefix`, in name order"""
+        if self.sorted_rows is None:
+            self.build_prefix()
+
+        prefix = prefix.casefold()
+        start = bisect.bisect_left(self.sorted_names, prefix)
+        # Any string starting with prefix sorts before prefix + U+10FFFF
+        end = bisect.bisect_left(self.sorted_names, prefix + "\U0010ffff", start)
+        return self.sorted_rows[start:end]
+
+    def exact_rows(self, name: str) -> Sequence[int]:
+        if self.exact is None:
+            exact: Dict[str, List[int]] = {}
+            for row, folded in enumerate(self.folded_names()):
+                exact.setdefault(folded, []).append(row)
+            self.exact = exact
+        return self.exact.get(name.casefold(), ())
+
+    def partition(self, scope: str) -> Sequence[int]:
+        if self.partitions is None:
+            types = array("q")
+            names = array("q")
+            for row, action in enumerate(self.actions):
+                (types if action.id.startswith("struct:") else names).append(row)
+            self.partitions = {"types": types, "names": names}
+        return self.partitions[scope]
+
+    def in_scope(self, rows: Sequence[int], scope: str) -> Sequence[int]:
+        if not scope:
+            return rows
+        is_type = scope == "types"
+        return [row for row in rows if self.actions[row].id.startswith("struct:") == is_type]
+
+    def segment_match(self, row: int, query: str) -> bool:
+        """Acronym/segment match of lowercase `query` against the name at `row`"""
+        action = self.actions[row]
+        lowered = action.key.lower()
+        entry = self.bounds[row]
+        if entry is None:
+            if isinstance(action, SpilledAction):
+                offsets = action.boundaries()
+            else:
+                offsets = boundaries(action.name)
+            entry = self.bounds[row] = (offsets, "".join(lowered[i] for i in offsets))
+
+        offsets, initials = entry
+        # The query has to start a segment
+        if query[0] not in initials:
+            return False
+        return segment_match(query, lowered, offsets)
+
+    def memory_report(self) -> Dict[str, int]:
+        """Bytes of the structures built so far, in the shape of
+        `spill.memory_report`. Keys of spilled rows are counted with their
+        ColdStore."""
+        total = sys.getsizeof(self.bounds) + sum(
+            sys.getsizeof(entry) + sys.getsizeof(entry[0]) + sys.getsizeof(entry[1])
+            for entry in self.bounds if entry is not None)
+        for column in (self.eas, self.ea_rows, self.sorted_rows, self.sorted_names, self.duplicates):
+            if column is not None:
+                total += sys.getsizeof(column)
+        if self.folded is not None:
+            total += sys.getsizeof(self.folded) + sum(
+                sys.getsizeof(folded) for folded, action in zip(self.folded, self.actions)
+                if not isinstance(action, SpilledAction))
+        if self.exact is not None:
+            total += sys.getsizeof(self.exact) + sum(map(sys.getsizeof, self.exact.values()))
+        if self.partitions is not None:
+            total += sum(map(sys.getsizeof, self.partitions.values()))
+        return {"rows": self.size, "spilled": 0, "resident_bytes": total, "mapped_bytes": 0}
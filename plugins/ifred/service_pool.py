@@ -0,0 +1,27 @@
+from typing import Callable, Dict, Optional
+
+from .filter import SearchService
+
+# Search services keyed by palette name. They survive palette windows, so the
+# indexes, caches and worker thread of a palette stay warm between opens.
+_services: Dict[str, SearchService] = {}
+
+def acquire(name: str, factory: Callable[[], SearchService]) -> SearchService:
+    service = _services.get(name)
+    if service is None:
+        service = factory()
+        service.persistent = True
+        _services[name] = service
+    return service
+
+def get(name: str) -> Optional[SearchService]:
+    return _services.get(name)
+
+def release(name: str) -> None:
+    service = _services.pop(name, None)
+    if service is not None:
+        service.shutdown()
+
+def release_all() -> None:
+    for name in list(_services):
+        release(name)
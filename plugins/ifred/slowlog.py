@@ -0,0 +1,125 @@
+import json
+import hashlib
+import logging
+import logging.handlers
+import os
+import time
+from collections import Counter
+from typing import Dict, Iterable, Optional
+
+from .utils import load_json
+
+LOG_FILENAME = "slow_searches.jsonl"
+# JSON bytes of one hashed name: 12 hex digits, quotes and a comma
+HASH_BYTES = 15
+# A record's hashes take at most this fraction of the rotation size, so each
+# file keeps several records
+HASHES_PER_FILE = 8
+
+class SlowSearchLog:
+    """Searches slower than a threshold, one JSON object per line in a rotating file.
+
+    Each record has the keyword, corpus size and phase timings, and optionally
+    the corpus shape: the name length distribution ("shape") plus hashed names
+    ("hashes"), enough for `benchmark.py --slow-log` to rebuild a similar corpus
+    without storing the names themselves. Hashes are keyed with a random secret
+    of the log file that is never written, so they can't be checked against a
+    dictionary of likely names; only equal names within the file compare equal."""
+
+    def __init__(self, palette_name: str, path: str, threshold_ms: float = 500,
+                 snapshot: str = "shape", max_hashes: int = 8192,
+                 max_bytes: int = 1 << 20, backups: int = 3):
+        self.palette_name = palette_name
+        self.threshold_ms = threshold_ms
+        self.snapshot = snapshot
+        self.max_hashes = min(max_hashes, max_bytes // (HASH_BYTES * HASHES_PER_FILE))
+        self.logger = logger_for(path, max_bytes, backups)
+        self.key = hash_key_for(path)
+
+    def isSlow(self, metrics) -> bool:
+        return metrics.total_ms + metrics.queue_wait_ms >= self.threshold_ms
+
+    def record(self, metrics, names: Iterable[str]) -> bool:
+        if not self.isSlow(metrics):
+            return False
+        total_ms = metrics.total_ms + metrics.queue_wait_ms
+
+        entry = {
+            "time": time.strftime("%Y-%m-%dT%H:%M:%S"),
+            "palette": hash_name(self.palette_name, self.key),
+            "keyword": metrics.keyword,
+            "corpus": metrics.corpus,
+            "scanned": metrics.scanned,
+            "candidates": metrics.candidates,
+            "queue_wait_ms": round(metrics.queue_wait_ms, 2),
+            "total_ms": round(total_ms, 2),
+            "phases": {phase: round(ms, 2) for phase, ms in metrics.phases.items()},
+        }
+        if metrics.sources:
+            entry["sources"] = {source: round(ms, 2) for source, ms in metrics.sources.items()}
+        if self.snapshot in ("shape", "hashes"):
+            entry.update(corpus_shape(names, self.max_hashes if self.snapshot == "hashes" else 0, self.key))
+
+        self.logger.info(json.dumps(entry, separators=(",", ":")))
+        return True
+
+def hash_name(name: str, key: bytes = b"") -> str:
+    return hashlib.blake2b(name.encode("utf-8", "replace"), digest_size=6, key=key).hexdigest()
+
+def corpus_shape(names: Iterable[str], max_hashes: int = 0, key: bytes = b"") -> dict:
+    lengths = Counter()
+    hashes = []
+    for name in names:
+        lengths[len(name)] += 1
+        if len(hashes) < max_hashes:
+            hashes.append(hash_name(name, key))
+
+    shape = {"lengths": {str(length): count for length, count in sorted(lengths.items())}}
+    if hashes:
+        shape["hashes"] = hashes
+    return shape
+
+loggers: Dict[str, logging.Logger] = {}
+# Secret hash key of each log file, for as long as IDA runs
+hash_keys: Dict[str, bytes] = {}
+
+def hash_key_for(path: str) -> bytes:
+    key = hash_keys.get(path)
+    if key is None:
+        key = hash_keys[path] = os.urandom(16)
+    return key
+
+def logger_for(path: str, max_bytes: int, backups: int) -> logging.Logger:
+    logger = loggers.get(path)
+    if logger is None:
+        logger = logging.getLogger(f"ifred.slowlog.{len(loggers)}")
+        logger.propagate = False
+        logger.setLevel(logging.INFO)
+        handler = logging.handlers.RotatingFileHandler(
+            path, maxBytes=max_bytes, backupCount=backups, encoding="utf-8", delay=True)
+        handler.setFormatter(logging.Formatter("%(message)s"))
+        logger.addHandler(handler)
+        loggers[path] = logger
+    return logger
+
+def from_config(palette_name: str) -> Optional[SlowSearchLog]:
+    """The slow search log configured under "slow_log" in config.json, if enabled"""
+    from . import api
+    config = load_json("config.json").get("slow_log", {})
+    if not config.get("enabled"):
+        return None
+
+    return SlowSearchLog(
+        palette_name, api.pluginPath(LOG_FILENAME),
+        threshold_ms=config.get("threshold_ms", 500),
+        snapshot=config.get("snapshot", "shape"),
+        max_hashes=config.get("max_hashes", 8192),
+        max_bytes=config.get("max_bytes", 1 << 20),
+        backups=config.get("backups", 3))
+
+def read(path: str):
+    with open(path, "r", encoding="utf-8") as f:
+        for line in f:
+            line = line.strip()
+            if line:
+                yield json.loads(line)
@@ -0,0 +1,184 @@
+"""Spilling display text out of the Python heap.
+
+Large databases have hundreds of thousands of names, and an `Action` per
+name with its id and name strings costs a couple hundred bytes of IDA's
+heap. Spilled, a name keeps only a small slotted object and the columns
+searches read, its casefolded name and its EA or ordinal, in arrays and a
+deduplicated pool. The text shown, demangled names and type descriptions,
+is written once to a memory-mapped temporary file and decoded only for the
+rows painted, so it lives in the OS page cache, which can evict it, rather
+than in the heap."""
+import mmap
+import sys
+import tempfile
+from array import array
+from itertools import accumulate
+from typing import Dict, List, Sequence, Tuple
+
+from .action import Action
+
+# Id prefixes of the actions spilled: EAs and local type ordinals
+SPILLED_IDS = ("0x", "struct:")
+
+class ColdStore:
+    """Ids, search keys and display text of spilled actions, row by row.
+
+    Ids are numbers after `prefix`. Search keys (casefolded names) and the
+    segment starts of each name stay resident, each distinct one stored once. Display text is stored once per distinct string in UTF-8
+    in the mapped file; rows refer to them by number. Never modified, as
+    searches on worker threads may be reading it."""
+
+    def __init__(self, numbers: Sequence[int], names: Sequence[str], prefix: str = "0x"):
+        from .search_index import boundaries
+        self.prefix = prefix
+        self.eas = array("Q", numbers)
+        keys: Dict[str, int] = {}
+        pool: Dict[str, int] = {}
+        self.key_ids = array("I")
+        self.name_ids = array("I")
+        for name in names:
+            self.name_ids.append(pool.setdefault(name, len(pool)))
+            self.key_ids.append(keys.setdefault(name.casefold(), len(keys)))
+        self.keys: List[str] = list(keys)
+        # Segment starts of name n are segments[segment_starts[n]:segment_starts[n + 1]]
+        self.segments = array("H")
+        self.segment_starts = array("I", [0])
+        for name in pool:
+            self.segments.extend(offset for offset in boundaries(name) if offset < 0x10000)
+            self.segment_starts.append(len(self.segments))
+        encoded = [name.encode("utf-8") for name in pool]
+        self.offsets = array("Q", [0])
+        self.offsets.extend(accumulate(map(len, encoded)))
+        self.file = tempfile.TemporaryFile(prefix="ifred-")
+        self.file.write(b"".join(encoded))
+        self.file.flush()
+        # mmap can't map an empty file
+        self.map = mmap.mmap(self.file.fileno(), 0, access=mmap.ACCESS_READ) if self.offsets[-1] else b""
+
+    def __len__(self) -> int:
+        return len(self.eas)
+
+    def id(self, row: int) -> str:
+        number = self.eas[row]
+        return hex(number) if self.prefix == "0x" else f"{self.prefix}{number}"
+
+    def key(self, row: int) -> str:
+        return self.keys[self.key_ids[row]]
+
+    def boundaries(self, row: int) -> Tuple[int, ...]:
+        name_id = self.name_ids[row]
+        return tuple(self.segments[self.segment_starts[name_id]:self.segment_starts[name_id + 1]])
+
+    def name(self, row: int) -> str:
+        name_id = self.name_ids[row]
+        return self.map[self.offsets[name_id]:self.offsets[name_id + 1]].decode("utf-8")
+
+    @property
+    def mapped_bytes(self) -> int:
+        return self.offsets[-1]
+
+    @property
+    def resident_bytes(self) -> int:
+        return (sys.getsizeof(self.eas) + sys.getsizeof(self.key_ids) + sys.getsizeof(self.name_ids)
+                + sys.getsizeof(self.offsets) + sys.getsizeof(self.keys) + sum(map(sys.getsizeof, self.keys))
+                + sys.getsizeof(self.segments) + sys.getsizeof(self.segment_starts))
+
+class SpilledAction:
+    """An `Action` whose id, search key and name are read from a ColdStore.
+    Not a subclass: Action instances carry a __dict__, which would double the
+    size."""
+    __slots__ = ("row", "store", "score")
+    shortcut = ""
+    description = ""
+
+    def __init__(self, row: int, store: ColdStore):
+        self.row = row
+        self.store = store
+
+    @property
+    def id(self) -> str:
+        return self.store.id(self.row)
+
+    @property
+    def key(self) -> str:
+        return self.store.key(self.row)
+
+    # Already casefolded
+    folded = key
+
+    @property
+    def name(self) -> str:
+        return self.store.name(self.row)
+
+    def boundaries(self) -> Tuple[int, ...]:
+        """`search_index.boundaries` of the name, without reading it"""
+        return self.store.boundaries(self.row)
+
+    def moved(self, ea: int) -> "SpilledAction":
+        return MovedAction(self.row, self.store, ea)
+
+    def __repr__(self) -> str:
+        return f"{type(self).__name__}(id={self.id!r}, name={self.name!r})"
+
+class MovedAction(SpilledAction):
+    """A spilled action rebased to another EA"""
+    __slots__ = ("ea",)
+
+    def __init__(self, row: int, store: ColdStore, ea: int):
+        super().__init__(row, store)
+        self.ea = ea
+
+    @property
+    def id(self) -> str:
+        return hex(self.ea)
+
+def spill(actions: List[Action]) -> List[Action]:
+    """`actions` with every EA or type keyed one spilled, to a new ColdStore
+    per kind of id"""
+    spilled: Dict[int, SpilledAction] = {}
+    for prefix in SPILLED_IDS:
+        rows = [row for row, action in enumerate(actions)
+                if action.id.startswith(prefix) and not isinstance(action, SpilledAction)]
+        if not rows:
+            continue
+        numbers = [int(actions[row].id, 16) if prefix == "0x" else int(actions[row].id[len(prefix):])
+                   for row in rows]
+        store = ColdStore(numbers, [actions[row].name for row in rows], prefix)
+        spilled.update((row, SpilledAction(i, store)) for i, row in enumerate(rows))
+    if not spilled:
+        return actions
+    return [spilled.get(row, action) for row, action in enumerate(actions)]
+
+def resident_bytes(actions: Sequence[Action]) -> int:
+    """Estimated heap taken by `actions`, excluding their ColdStores. Names
+    shared by several actions (interned) count once."""
+    total = sys.getsizeof(actions)
+    names = set()
+    for action in actions:
+        if isinstance(action, SpilledAction):
+            total += sys.getsizeof(action) + sys.getsizeof(action.row)
+        else:
+            total += sys.getsizeof(action) + sys.getsizeof(action.id)
+            if id(action.name) not in names:
+                names.add(id(action.name))
+                total += sys.getsizeof(action.name)
+    return total
+
+def memory_report(corpora: Dict[str, Sequence[Action]]) -> Dict[str, Dict[str, int]]:
+    """Resident and memory-mapped bytes of each corpus"""
+    report = {}
+    for name, actions in corpora.items():
+        stores = {id(action.store): action.store for action in actions if isinstance(action, SpilledAction)}
+        report[name] = {
+            "rows": len(actions),
+            "spilled": sum(1 for action in actions if isinstance(action, SpilledAction)),
+            "resident_bytes": resident_bytes(actions) + sum(store.resident_bytes for store in stores.values()),
+            "mapped_bytes": sum(store.mapped_bytes for store in stores.values()),
+        }
+    return report
+
+def format_report(report: Dict[str, Dict[str, int]]) -> str:
+    return ", ".join(f"{name} {entry['rows']:,} rows ({entry['spilled']:,} spilled): "
+                     f"{entry['resident_bytes'] / 2**20:.1f} MiB resident, "
+                     f"{entry['mapped_bytes'] / 2**20:.1f} MiB mapped"
+                     for name, entry in report.items())
@@ -1,12 +1,15 @@
 import os, sys
+import argparse
+import json
 import random
+import time
 
 basedir = os.path.abspath(os.path.dirname(__file__))
 sys.path.append(os.path.abspath(basedir + "/../"))
 
 from ifred.qt_bindings import *
 from ifred.filter import SearchService
-from ifred.api import set_path_handler
+from ifred.api import cleanup_palettes, set_path_handler
 from ifred.action import Action
 from ifred.CommandPalette import CommandPalette
 
@@ -40,35 +43,211 @@ def test_items(count=COUNT):
     return action_list
 
 class CustomService(SearchService):
-    start_searching = Signal(str)
-    done_searching = Signal(str, list, int)
+    start_searching = Signal(str, int)
+    done_searching = Signal(str, list, int, int)
 
     def __init__(self):
         super().__init__(None)
         self.items = test_items(500)
         self.start_searching.connect(self.on_search)
 
-    def on_search(self, keyword):
+    def on_search(self, keyword, generation):
         # Shuffle items
         items_copy = self.items.copy()
         random.shuffle(items_copy)
-        self.done_searching.emit(keyword, items_copy, 0)
+        self.done_searching.emit(keyword, items_copy, 0, generation)
         self.done_searching.emit(
             keyword,
             [{"id": "install", "name": "Press ENTER to install your extension."}],
-            0
+            0,
+            generation
         )
 
-    def cancel(self):
-        pass
-
     def runInSeparateThread(self) -> bool:
         return True
 
 def TestPluginPath(name):
     return f"{basedir}/res/{name}"
 
+FRAME_MS = 1000 / 60
+
+class UIBenchmark:
+    """Scripted palette session measuring model updates and paint cost"""
+
+    def __init__(self, app: QApplication, palette: CommandPalette):
+        self.app = app
+        self.frame = palette.centralWidget()
+        self.view = self.frame.items
+        self.model = self.view.model()
+        self.layout_started = None
+        self.done = False
+        self.model_updates = []
+        self.search_latencies = []
+        self.frames = []
+        # Waiting in a local event loop leaves the GIL to the worker thread
+        # instead of spinning on processEvents()
+        self.loop = QEventLoop()
+        # One timeout for whichever wait is running, stopped when results arrive
+        # so a stale timeout can't end a later wait early
+        self.timeout = QTimer()
+        self.timeout.setSingleShot(True)
+        self.timeout.timeout.connect(self.loop.quit)
+
+        self.model.layoutAboutToBeChanged.connect(self._on_layout_started)
+        self.model.filteringDone.connect(self._on_filtering_done)
+
+    def _on_layout_started(self):
+        self.layout_started = time.perf_counter()
+
+    def _on_filtering_done(self, recent_count):
+        if self.layout_started is not None:
+            self.model_updates.append((time.perf_counter() - self.layout_started) * 1000)
+            self.layout_started = None
+        self.done = True
+        self.timeout.stop()
+        self.loop.quit()
+
+    def wait_results(self, timeout: float = 60.0) -> bool:
+        if not self.done:
+            self.timeout.start(int(timeout * 1000))
+            self.loop.exec()
+            self.timeout.stop()
+        return self.done
+
+    def step(self, kind: str, action) -> None:
+        """One frame: run `action`, let Qt process it, then paint the list"""
+        start = time.perf_counter()
+        action()
+        self.loop.processEvents()
+        work_ms = (time.perf_counter() - start) * 1000
+
+        start = time.perf_counter()
+        self.view.viewport().repaint()
+        paint_ms = (time.perf_counter() - start) * 1000
+
+        self.frames.append((kind, work_ms, paint_ms))
+
+    def type_query(self, query: str) -> None:
+        if self.frame.searchbox.text():
+            self.done = False
+            self.frame.searchbox.clear()
+            self.wait_results()
+
+        for i in range(1, len(query) + 1):
+            self.done = False
+            start = time.perf_counter()
+            self.step("type", lambda text=query[:i]: self.frame.searchbox.setText(text))
+            self.wait_results()
+            self.search_latencies.append((time.perf_counter() - start) * 1000)
+            self.step("type", lambda: None)
+
+    def scroll(self, steps: int) -> None:
+        bar = self.view.verticalScrollBar()
+        for _ in range(steps):
+            self.step("scroll", lambda: bar.setValue(bar.value() + bar.singleStep() * 3))
+
+    def page(self, steps: int, key=Qt.Key_PageDown) -> None:
+        for _ in range(steps):
+            event = QKeyEvent(QEvent.KeyPress, key, Qt.NoModifier)
+            self.step("page", lambda: QApplication.sendEvent(self.frame.searchbox, event))
+
+    def hold(self, frames: int, key=Qt.Key_Down, repeats: int = 2) -> None:
+        """Hold `key` down for `frames` frames, `repeats` auto-repeated presses
+        arriving per frame"""
+        def press():
+            for _ in range(repeats):
+                QApplication.postEvent(self.frame.searchbox,
+                                       QKeyEvent(QEvent.KeyPress, key, Qt.NoModifier, "", True))
+        for _ in range(frames):
+            self.step("hold", press)
+
+    def report(self) -> dict:
+        def summary(values):
+            values = sorted(values)
+            if not values:
+                return {"count": 0}
+            return {
+                "count": len(values),
+                "mean_ms": sum(values) / len(values),
+                "p50_ms": values[len(values) // 2],
+                "p90_ms": values[min(len(values) - 1, int(len(values) * 0.9))],
+                "max_ms": values[-1],
+            }
+
+        result = {
+            "model_update": summary(self.model_updates),
+            "search_latency": summary(self.search_latencies),
+        }
+        for kind in ("type", "scroll", "page", "hold"):
+            frames = [(work, paint) for k, work, paint in self.frames if k == kind]
+            result[kind] = {
+                "paint": summary([paint for _, paint in frames]),
+                "frame": summary([work + paint for work, paint in frames]),
+                # Frames a 60Hz display would have missed while this step ran
+                "frames_dropped": sum(int((work + paint) // FRAME_MS) for work, paint in frames),
+            }
+        return result
+
+def run_benchmark(args) -> dict:
+    os.environ.setdefault("QT_QPA_PLATFORM", "offscreen")
+    app = QApplication.instance() or QApplication([])
+    set_path_handler(TestPluginPath)
+
+    if args.corpus == "ida":
+        from ifred import synthetic
+        items = synthetic.ida_corpus(args.count)
+    else:
+        items = test_items(args.count)
+
+    palette = CommandPalette()
+    palette.setWindowFlags(Qt.Tool)
+    palette.setAttribute(Qt.WA_TranslucentBackground, False)
+    palette.resize(800, 600)
+    palette.show("<benchmark palette>", "Enter item name...", items, "Ctrl+P", lambda action: False)
+
+    bench = UIBenchmark(app, palette)
+    bench.wait_results()
+
+    for query in args.queries.split(","):
+        bench.type_query(query)
+        bench.scroll(args.scroll)
+        bench.page(args.pages)
+        bench.page(args.pages, Qt.Key_PageUp)
+        bench.hold(args.hold, Qt.Key_Down, args.repeats)
+        bench.hold(args.hold, Qt.Key_PageDown, args.repeats)
+        bench.hold(args.hold, Qt.Key_PageUp, args.repeats)
+
+    report = bench.report()
+    report["hold"]["final_row"] = bench.view.currentIndex().row()
+    report["meta"] = {"count": args.count, "corpus": args.corpus, "qt_api": QT_API,
+                      "platform": QGuiApplication.platformName()}
+
+    palette.close()
+    cleanup_palettes()
+    return report
+
 def main():
+    parser = argparse.ArgumentParser(description="Standalone palette for testing without IDA")
+    parser.add_argument("--bench", action="store_true", help="run the scripted rendering benchmark offscreen")
+    parser.add_argument("--count", type=int, default=COUNT)
+    parser.add_argument("--corpus", choices=["test", "ida"], default="test")
+    parser.add_argument("--queries", default="a,ab1,ff0")
+    parser.add_argument("--scroll", type=int, default=50, help="scroll steps per query")
+    parser.add_argument("--pages", type=int, default=20, help="page downs (and ups) per query")
+    parser.add_argument("--hold", type=int, default=60, help="frames Down, PageDown and PageUp are held per query")
+    parser.add_argument("--repeats", type=int, default=2, help="auto-repeated presses arriving per held frame")
+    parser.add_argument("--json", help="write the benchmark report to this file, - for stdout")
+    args = parser.parse_args()
+
+    if args.bench:
+        report = run_benchmark(args)
+        if args.json and args.json != "-":
+            with open(args.json, "w", encoding="utf-8") as f:
+                json.dump(report, f, indent=2)
+        else:
+            json.dump(report, sys.stdout, indent=2)
+        return
+
     app = QApplication([])
     # Assuming set_path_handler is defined elsewhere
     set_path_handler(TestPluginPath)
@@ -87,12 +266,13 @@ def main():
         print(f"Action: {action.id} {action.name} {action.shortcut}")
         return False
 
-    palette.show("<test palette>", "Enter item name...", test_items(),
+    palette.show("<test palette>", "Enter item name...", test_items(args.count),
                 "Ctrl+P", action_handler)
     # palette.show("<test palette>", "Enter item name...", CustomService(),
     #             "Ctrl+P", action_handler)
 
     app.exec()
+    cleanup_palettes()
 
 if __name__ == "__main__":
     main()
@@ -0,0 +1,85 @@
+"""Startup timings of the IDA plugin.
+
+ifred_plugin.py registers its actions with handlers that import the
+palettes, Qt, rapidfuzz and the search modules on first use or when IDA is
+idle. This records how long each step took and, like `python -X
+importtime`, the self time of every module those imports loaded:
+`print(ifred.startup.report())` in IDA's console. Standard library only."""
+import builtins
+import sys
+import time
+from contextlib import contextmanager
+from typing import Dict, List, Tuple
+
+# (step, milliseconds) in the order they ran
+phases: List[Tuple[str, float]] = []
+# Milliseconds spent importing each module, excluding the modules it imported
+modules: Dict[str, float] = {}
+
+def record(step: str, started: float) -> None:
+    phases.append((step, (time.perf_counter() - started) * 1000))
+
+@contextmanager
+def timed(step: str):
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        record(step, started)
+
+def module_name(name: str, globals, level: int) -> str:
+    if not level:
+        return name
+    package = (globals or {}).get("__package__") or ""
+    base = package.rsplit(".", level - 1)[0] if level > 1 else package
+    return f"{base}.{name}" if name else base
+
+class ImportTimer:
+    """Times the imports made while active through builtins.__import__. Meant
+    for the main thread: imports on other threads meanwhile skew the split."""
+
+    def __init__(self):
+        # Time spent in nested imports, one entry per import in progress
+        self.nested: List[float] = []
+
+    def __enter__(self) -> "ImportTimer":
+        self.original = builtins.__import__
+        builtins.__import__ = self.timed_import
+        return self
+
+    def __exit__(self, *exc) -> None:
+        builtins.__import__ = self.original
+
+    def import_module(self, name: str):
+        """importlib.import_module, which bypasses __import__, timed like an
+        import statement"""
+        self.timed_import(name)
+        return sys.modules[name]
+
+    def timed_import(self, name, globals=None, locals=None, fromlist=(), level=0):
+        loaded = len(sys.modules)
+        started = time.perf_counter()
+        self.nested.append(0.0)
+        try:
+            return self.original(name, globals, locals, fromlist, level)
+        finally:
+            elapsed = time.perf_counter() - started
+            nested = self.nested.pop()
+            if self.nested:
+                self.nested[-1] += elapsed
+            if len(sys.modules) > loaded:
+                key = module_name(name, globals, level)
+                modules[key] = modules.get(key, 0.0) + (elapsed - nested) * 1000
+
+@contextmanager
+def timed_imports(step: str):
+    with timed(step), ImportTimer() as imports:
+        yield imports
+
+def report(slowest: int = 10) -> str:
+    lines = [f"{step}: {ms:.1f}ms" for step, ms in phases]
+    if modules:
+        top = sorted(modules.items(), key=lambda item: -item[1])[:slowest]
+        lines.append(f"{len(modules)} modules imported, slowest: "
+                     + ", ".join(f"{name} {ms:.1f}ms" for name, ms in top))
+    return "[ifred] startup " + ("; ".join(lines) if lines else "nothing recorded")
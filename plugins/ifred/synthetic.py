@@ -0,0 +1,142 @@
+"""Synthetic IDA-like corpora and keystroke sequences for benchmarks.
+
+Names mimic what the name palette sees in real databases: demangled C++
+members with namespaces and templates, auto-generated `sub_XXXX` style
+names, imports and local types (ids starting with `struct:`)."""
+import random
+from typing import Iterable, List
+
+from .action import Action
+
+NAMESPACES = ["std", "std::__1", "boost", "llvm", "Qt", "detail", "impl", "v8::internal",
+              "mozilla", "base", "absl", "folly", "net", "ui", "core"]
+CLASSES = ["basic_string", "vector", "map", "unordered_map", "shared_ptr", "unique_ptr",
+           "Allocator", "Parser", "Lexer", "Token", "Widget", "Buffer", "Stream",
+           "HttpRequest", "FileSystem", "ThreadPool", "Mutex", "Logger", "Config", "Node"]
+METHODS = ["append", "insert", "erase", "find", "reserve", "resize", "push_back", "emplace",
+           "get", "set", "reset", "release", "parse", "tokenize", "read", "write", "flush",
+           "open", "close", "lock", "unlock", "onEvent", "handleMessage", "getValue",
+           "setValue", "toString", "operator=", "operator[]", "~", ""]
+TYPES = ["char", "int", "unsigned int", "long", "wchar_t", "float", "double", "bool",
+         "void*", "std::allocator<char>", "std::char_traits<char>", "size_t"]
+PREFIXES = ["sub_", "sub_", "sub_", "loc_", "j_", "nullsub_", "unk_", "off_", "dword_",
+            "qword_", "byte_", "asc_", "stru_"]
+WORDS = ["error", "failed", "to", "open", "file", "invalid", "argument", "%s", "%d", "cannot",
+         "allocate", "memory", "connection", "timeout", "user", "password", "config", "version",
+         "http://", "https://", "Content-Type", "application/json", "\\n", "warning", "debug"]
+IMPORTS = ["CreateFileW", "ReadFile", "WriteFile", "CloseHandle", "VirtualAlloc", "malloc",
+           "free", "memcpy", "memset", "strlen", "printf", "fopen", "pthread_create",
+           "GetProcAddress", "LoadLibraryA", "HeapAlloc", "RtlUnwind", "__cxa_throw"]
+
+# Share of each name kind in the generated corpus
+MIX = (("cxx", 0.45), ("auto", 0.40), ("import", 0.05), ("type", 0.10))
+
+# Query sets typed keystroke by keystroke
+DEFAULT_QUERIES = ["sub_40", "append", "bsa", "basic_string::append", "ctor", "0x401a3c",
+                   "HttpRequest", "read", "zzq"]
+
+def template_args(rng: random.Random) -> str:
+    args = rng.sample(TYPES, rng.randint(1, 3))
+    return "<" + ",".join(args) + ">"
+
+def cxx_name(rng: random.Random) -> str:
+    name = rng.choice(NAMESPACES) + "::" + rng.choice(CLASSES)
+    if rng.random() < 0.4:
+        name += template_args(rng)
+    method = rng.choice(METHODS)
+    if method == "~":
+        method = "~" + name.rsplit("::", 1)[-1].split("<")[0]
+    elif not method:
+        method = name.rsplit("::", 1)[-1].split("<")[0]
+    return name + "::" + method
+
+def auto_name(rng: random.Random, ea: int) -> str:
+    return f"{rng.choice(PREFIXES)}{ea:X}"
+
+def import_name(rng: random.Random) -> str:
+    name = rng.choice(IMPORTS)
+    return name if rng.random() < 0.7 else "__imp_" + name
+
+def type_name(rng: random.Random) -> str:
+    kind = rng.choice(["struct", "enum", "union", "class"])
+    return f"{kind} {rng.choice(CLASSES)}{rng.choice(['', 'Impl', 'Base', 'Info', 'Entry', '_t'])}{rng.randint(0, 999)}"
+
+def string_literal(rng: random.Random) -> str:
+    return " ".join(rng.choice(WORDS) for _ in range(rng.randint(1, 8)))
+
+def function_signature(rng: random.Random, name: str) -> str:
+    args = ", ".join(f"{rng.choice(TYPES)} a{i}" for i in range(rng.randint(0, 4)))
+    return f"{rng.choice(TYPES)} __fastcall {name}({args})"
+
+def ida_corpus(count: int, seed: int = 0, base: int = 0x401000) -> List[Action]:
+    """`count` name palette entries with increasing EAs, like get_nlist_ea order"""
+    rng = random.Random(seed)
+    kinds = [kind for kind, _ in MIX]
+    weights = [weight for _, weight in MIX]
+    result = []
+    ea = base
+    ordinal = 1
+
+    for kind in rng.choices(kinds, weights, k=count):
+        if kind == "type":
+            result.append(Action(f"struct:{ordinal}", type_name(rng)))
+            ordinal += 1
+            continue
+
+        ea += rng.randint(2, 0x80)
+        if kind == "cxx":
+            name = cxx_name(rng)
+        elif kind == "auto":
+            name = auto_name(rng, ea)
+        else:
+            name = import_name(rng)
+        result.append(Action(hex(ea), name))
+
+    return result
+
+def fit_name(rng: random.Random, length: int, ea: int) -> str:
+    """A plausible name of exactly `length` characters"""
+    name = cxx_name(rng) if rng.random() < 0.5 else auto_name(rng, ea)
+    while len(name) < length:
+        name += "::" + rng.choice(METHODS + CLASSES)
+    return name[:length]
+
+def corpus_from_shape(shape: dict, seed: int = 0, base: int = 0x401000) -> List[Action]:
+    """Corpus with the name length distribution of a slow search log record.
+    Names whose hashes repeat in the record are repeated here too."""
+    rng = random.Random(seed)
+    lengths = []
+    for length, count in shape.get("lengths", {}).items():
+        lengths += [int(length)] * count
+    rng.shuffle(lengths)
+
+    hashes = shape.get("hashes", [])
+    names_by_hash = {}
+    result = []
+    ea = base
+    for i, length in enumerate(lengths):
+        ea += rng.randint(2, 0x80)
+        hashed = hashes[i] if i < len(hashes) else None
+        name = names_by_hash.get(hashed)
+        if name is None:
+            name = fit_name(rng, length, ea)
+            if hashed is not None:
+                names_by_hash[hashed] = name
+        result.append(Action(hex(ea), name))
+    return result
+
+def keystrokes(query: str) -> List[str]:
+    """Keyword states produced by typing `query` one character at a time"""
+    return [query[:i] for i in range(1, len(query) + 1)]
+
+def keystroke_sequences(queries: Iterable[str]) -> List[List[str]]:
+    return [keystrokes(query) for query in queries]
+
+def parse_size(text: str) -> int:
+    text = text.strip().lower()
+    scale = 1
+    if text.endswith("k"):
+        scale, text = 1000, text[:-1]
+    elif text.endswith("m"):
+        scale, text = 1000000, text[:-1]
+    return int(float(text) * scale)
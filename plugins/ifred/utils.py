@@ -1,73 +1,144 @@
+import os
 import json as json_lib
-from typing import Callable, Optional
+from typing import Any, Callable, Dict, Optional, Tuple
 from .qt_bindings import *
 
-static_updated = False
-from . import api
+search_path_added = False
 
-def load_file_from_bundle(filename: str, file: QFile, updated: bool) -> str:
-    resource_initialized = False
-
-    if not resource_initialized:
-        # Initialize Qt resource system
-        # Note: Q_INIT_RESOURCE needs to be handled differently in Python
-        # This is typically done through pyrcc tool or QResource.registerResource()
-        resource_initialized = True
+def add_theme_search_path() -> None:
+    global search_path_added
+    if not search_path_added:
+        from . import api
         QDir.addSearchPath("theme", api.pluginPath("theme/"))
+        search_path_added = True
 
+def load_file_from_bundle(filename: str, file: QFile) -> str:
+    # Note: Q_INIT_RESOURCE needs to be handled differently in Python
+    # This is typically done through pyrcc tool or QResource.registerResource()
     res_file = QFile(f":/bundle/{filename}")
-    updated = False
-
-    if res_file.exists():
-        if not res_file.open(QIODevice.ReadOnly):
-            return ""
-
-        bytes_data = res_file.readAll()
-        content = str(bytes_data.data(), 'utf-8')
-
-        dir_path = QDir(file.fileName())
-        dir_path.mkpath("..")
 
-        if file.open(QIODevice.WriteOnly):
-            file.write(bytes_data)
-            file.close()
-
-        updated = True
-        return content
-    else:
+    if not res_file.exists():
         return ""
 
-def loadFile(filename: str, force_update: bool = False, updated: bool = static_updated) -> str:
-    absolute_path = api.pluginPath(filename)
-    file = QFile(absolute_path)
-
-    updated = False
-
-    if not file.exists():
-        # Check if it exists in bundle resource
-        return load_file_from_bundle(filename, file, updated)
-
-    if not file.open(QIODevice.ReadOnly):
+    if not res_file.open(QIODevice.ReadOnly):
         return ""
 
-    content = str(file.readAll().data(), 'utf-8')
-    updated = True
+    bytes_data = res_file.readAll()
+    content = str(bytes_data.data(), 'utf-8')
 
-    return content
-
-# Cache for JSON documents
-cached_json = {}
+    # Extract the bundled file once, later loads read it from disk
+    dir_path = QDir(file.fileName())
+    dir_path.mkpath("..")
 
-def load_json(filename: str, force_update: bool = False) -> dict:
-    updated = False
-    content_str = loadFile(filename, force_update, updated)
+    if file.open(QIODevice.WriteOnly):
+        file.write(bytes_data)
+        file.close()
 
-    if not updated:
-        return cached_json.get(filename, {})
+    return content
 
+def file_stamp(path: str) -> Optional[Tuple[int, int]]:
     try:
-        json_data = json_lib.loads(content_str)
-        cached_json[filename] = json_data
-        return json_data
+        st = os.stat(path)
+    except OSError:
+        return None
+    return st.st_mtime_ns, st.st_size
+
+class Asset:
+    def __init__(self, stamp: Optional[Tuple[int, int]], text: str):
+        self.stamp = stamp
+        self.text = text
+        # Parsed forms of `text` (json, compiled patterns, ...) keyed by kind
+        self.derived: Dict[str, Any] = {}
+
+class AssetCache(QObject):
+    """Theme and config files keyed by path, revalidated by (mtime, size).
+
+    With watching enabled, entries are trusted until QFileSystemWatcher reports
+    a change, and `changed` is emitted so open widgets can hot reload."""
+    changed = Signal(str)
+
+    def __init__(self):
+        super().__init__()
+        self.entries: Dict[str, Asset] = {}
+        self.paths: Dict[str, str] = {}
+        self.watcher: Optional[QFileSystemWatcher] = None
+
+    def setWatching(self, enabled: bool) -> None:
+        if enabled == (self.watcher is not None):
+            return
+
+        if enabled:
+            self.watcher = QFileSystemWatcher(self)
+            self.watcher.fileChanged.connect(self._on_file_changed)
+            for path, entry in self.entries.items():
+                if entry.stamp is not None:
+                    self.watcher.addPath(path)
+        else:
+            self.watcher.deleteLater()
+            self.watcher = None
+
+    def _on_file_changed(self, path: str) -> None:
+        self.entries.pop(path, None)
+        # Editors often replace files, which drops them from the watcher
+        if os.path.exists(path) and path not in self.watcher.files():
+            self.watcher.addPath(path)
+        filename = self.paths.get(path)
+        if filename is not None:
+            self.changed.emit(filename)
+
+    def get(self, filename: str, force_update: bool = False) -> Asset:
+        # api imports the widgets, which import this module
+        from . import api
+        absolute_path = api.pluginPath(filename)
+        self.paths[absolute_path] = filename
+        entry = self.entries.get(absolute_path)
+
+        if entry is not None and not force_update:
+            if self.watcher is not None and entry.stamp is not None:
+                return entry
+            if file_stamp(absolute_path) == entry.stamp:
+                return entry
+
+        entry = self._load(filename, absolute_path)
+        self.entries[absolute_path] = entry
+        if self.watcher is not None and entry.stamp is not None:
+            self.watcher.addPath(absolute_path)
+        return entry
+
+    def _load(self, filename: str, absolute_path: str) -> Asset:
+        add_theme_search_path()
+        file = QFile(absolute_path)
+
+        if not file.exists():
+            # Check if it exists in bundle resource
+            text = load_file_from_bundle(filename, file)
+            return Asset(file_stamp(absolute_path), text)
+
+        stamp = file_stamp(absolute_path)
+        if not file.open(QIODevice.ReadOnly):
+            return Asset(None, "")
+
+        content = str(file.readAll().data(), 'utf-8')
+        return Asset(stamp, content)
+
+    def derived(self, filename: str, kind: str, build: Callable[[str], Any]) -> Any:
+        entry = self.get(filename)
+        if kind not in entry.derived:
+            entry.derived[kind] = build(entry.text)
+        return entry.derived[kind]
+
+asset_cache = AssetCache()
+
+def loadFile(filename: str, force_update: bool = False) -> str:
+    return asset_cache.get(filename, force_update).text
+
+def parse_json(content_str: str) -> dict:
+    try:
+        return json_lib.loads(content_str)
     except json_lib.JSONDecodeError:
         return {}
+
+def load_json(filename: str, force_update: bool = False) -> dict:
+    if force_update:
+        asset_cache.get(filename, True)
+    return asset_cache.derived(filename, "json", parse_json)
@@ -0,0 +1,146 @@
+import threading
+from typing import Callable, Dict, Generic, Iterable, Iterator, List, Optional, TypeVar
+
+T = TypeVar("T")
+
+class VersionedList(Generic[T]):
+    """A list that readers on other threads see as immutable snapshots.
+
+    Writers (IDB hooks on the main thread) replace, append or pop items but
+    never modify an item in place. Changes since the last snapshot go to a
+    delta log; `snapshot()` applies them copy-on-write to a fresh list, so a
+    search can iterate the list it pinned while the next version is written.
+
+    Subscribers are called on the writer's thread with each change as
+    (old, new): (None, item) for appends, (item, None) for pops and
+    (None, None) when the whole list or many items were replaced."""
+
+    def __init__(self, items: Iterable[T] = ()):
+        self.lock = threading.Lock()
+        # Last published snapshot, never modified once returned
+        self.base: List[T] = list(items)
+        # Delta log: the first `size` items of base are kept, `changed`
+        # replaces some of them and `appended` follows
+        self.size = len(self.base)
+        self.changed: Dict[int, T] = {}
+        self.appended: List[T] = []
+        # Bumped on every write
+        self.version = 0
+        self.listeners: List[Callable[[Optional[T], Optional[T]], None]] = []
+
+    def subscribe(self, listener: Callable[[Optional[T], Optional[T]], None]) -> None:
+        self.listeners.append(listener)
+
+    def unsubscribe(self, listener: Callable[[Optional[T], Optional[T]], None]) -> None:
+        if listener in self.listeners:
+            self.listeners.remove(listener)
+
+    def notify(self, old: Optional[T], new: Optional[T]) -> None:
+        for listener in list(self.listeners):
+            listener(old, new)
+
+    def reset(self, items: List[T]) -> None:
+        """Replace the contents, taking ownership of `items`"""
+        with self.lock:
+            self.base = items
+            self.size = len(items)
+            self.changed = {}
+            self.appended = []
+            self.version += 1
+        self.notify(None, None)
+
+    def clear(self) -> None:
+        self.reset([])
+
+    def __len__(self) -> int:
+        # snapshot() moves items between these fields on other threads
+        with self.lock:
+            return self.size + len(self.appended)
+
+    def __bool__(self) -> bool:
+        return len(self) > 0
+
+    def __getitem__(self, index: int) -> T:
+        with self.lock:
+            if index < 0:
+                index += self.size + len(self.appended)
+            if index >= self.size:
+                return self.appended[index - self.size]
+            item = self.changed.get(index)
+            return self.base[index] if item is None else item
+
+    def __setitem__(self, index: int, item: T) -> None:
+        with self.lock:
+            if index < 0:
+                index += self.size + len(self.appended)
+            if index >= self.size:
+                old = self.appended[index - self.size]
+                self.appended[index - self.size] = item
+            else:
+                old = self.changed.get(index)
+                if old is None:
+                    old = self.base[index]
+                self.changed[index] = item
+            self.version += 1
+        self.notify(old, item)
+
+    def update(self, changes: Dict[int, T]) -> None:
+        """Replace many items at once, notified as a single (None, None)"""
+        with self.lock:
+            for index, item in changes.items():
+                if index >= self.size:
+                    self.appended[index - self.size] = item
+                else:
+                    self.changed[index] = item
+            self.version += 1
+        self.notify(None, None)
+
+    def __iter__(self) -> Iterator[T]:
+        return iter(self.snapshot())
+
+    def append(self, item: T) -> int:
+        """Append `item` and return its index"""
+        with self.lock:
+            self.appended.append(item)
+            index = self.size + len(self.appended) - 1
+            self.version += 1
+        self.notify(None, item)
+        return index
+
+    def extend(self, items: List[T]) -> int:
+        """Append many items, notified as a single (None, None). Returns the
+        index of the first one."""
+        with self.lock:
+            index = self.size + len(self.appended)
+            self.appended += items
+            self.version += 1
+        self.notify(None, None)
+        return index
+
+    def pop(self) -> T:
+        with self.lock:
+            if self.appended:
+                item = self.appended.pop()
+            else:
+                self.size -= 1
+                item = self.changed.pop(self.size, self.base[self.size])
+            self.version += 1
+        self.notify(item, None)
+        return item
+
+    def snapshot(self) -> List[T]:
+        """The current contents as a list nobody will modify"""
+        with self.lock:
+            if not self.changed and not self.appended and self.size == len(self.base):
+                return self.base
+
+            items = self.base[:self.size]
+            for index, item in self.changed.items():
+                items[index] = item
+            items += self.appended
+
+            self.base = items
+            self.size = len(items)
+            self.changed = {}
+            self.appended = []
+            return items